@@ -0,0 +1,140 @@
+import asyncio
+from collections import deque
+from GifInfo import (CHUNK_SIZE, Compositor, GifInfo, ImageDescriptor,
+                     IncrementalParser)
+
+
+class ChunkReader:
+    """Reads an async iterable of bytes chunks (a file read in chunks, the
+    body of an HTTP request) through `read` of asyncio.StreamReader. A
+    chunk is only pulled when the buffer is empty, so a slow parser does
+    not make the buffer grow. `data` is read before the chunks, with
+    `chunks` None it is all there is."""
+    def __init__(self, chunks, data=b''):
+        self.chunks = chunks.__aiter__() if chunks is not None else None
+        self.buffer = bytearray(data)
+
+    async def fill(self, size):
+        while len(self.buffer) < size and self.chunks is not None:
+            try:
+                self.buffer += await self.chunks.__anext__()
+            except StopAsyncIteration:
+                self.chunks = None
+
+    async def read(self, size=-1):
+        """Reads up to `size` bytes, all the bytes up to the end with -1."""
+        await self.fill(1 if size >= 0 else float('inf'))
+        if size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+
+async def read_file(filename, chunk_size=CHUNK_SIZE):
+    """Yields the chunks of a file, every one read in the default executor
+    so the event loop does not wait for the disk."""
+    loop = asyncio.get_running_loop()
+    with open(filename, 'rb') as f:
+        while True:
+            chunk = await loop.run_in_executor(None, f.read, chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def get_reader(source):
+    """Returns a reader of `source`: an asyncio.StreamReader (or anything
+    with an async `read`) as it is, a file name, bytes or an async
+    iterable of bytes chunks."""
+    if hasattr(source, 'read'):
+        return source
+    if isinstance(source, str):
+        return ChunkReader(read_file(source))
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return ChunkReader(None, source)
+    return ChunkReader(source)
+
+
+async def read_blocks(reader):
+    """Same as GifInfo.read_blocks for a reader (see get_reader): every
+    block is parsed as soon as its last bytes have arrived."""
+    parser = IncrementalParser(composite=False)
+    while True:
+        chunk = await reader.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        for kind, block in parser.feed(chunk):
+            if kind == 'end':
+                return
+            yield block
+    parser.close()
+
+
+def decode(descriptor, executor=None):
+    """Starts decoding the graphic block of `descriptor` in `executor`,
+    returns the future of its indices."""
+    lzw_code, *args = GifInfo.get_lzw_args(descriptor)
+    return asyncio.get_running_loop().run_in_executor(
+        executor, GifInfo.decode_lzw,
+        [bytes(subblock) for subblock in lzw_code], *args)
+
+
+async def aiter_frames(source, executor=None, prefetch=2, copy=True):
+    """Yields (frame, graphic_extension) for every image of the GIF like
+    GifInfo.iter_frames, without blocking the event loop.
+
+    `source` is anything `get_reader` takes. Graphic blocks are decoded in
+    `executor` (the default executor of the loop when None, a
+    ProcessPoolExecutor uses several cores) while the next blocks are
+    read: up to `prefetch` images are decoded ahead of the frame being
+    composited. If the file is broken, the frames before the error are
+    yielded first. Without `copy` frames are drawn in place, as by
+    GifInfo.iter_frames."""
+    blocks = read_blocks(get_reader(source))
+    lsd = await blocks.__anext__()
+    gct = await blocks.__anext__()
+    compositor = Compositor(int(lsd.width, 16), int(lsd.height, 16),
+                            GifInfo.get_bg_color(lsd, gct), in_place=not copy)
+    pending = deque()
+    error = None
+    try:
+        while True:
+            try:
+                block = await blocks.__anext__()
+            except StopAsyncIteration:
+                break
+            except ValueError as e:
+                error = e
+                break
+            if isinstance(block, ImageDescriptor):
+                pending.append((block, decode(block, executor)))
+                if len(pending) > prefetch:
+                    descriptor, indices = pending.popleft()
+                    yield (GifInfo.draw_image(compositor, descriptor, gct,
+                                              await indices),
+                           descriptor.graphic_extension)
+        while pending:
+            descriptor, indices = pending.popleft()
+            yield (GifInfo.draw_image(compositor, descriptor, gct,
+                                      await indices),
+                   descriptor.graphic_extension)
+    finally:
+        for _, indices in pending:
+            indices.cancel()
+    if error is not None:
+        raise error
+
+
+async def load_gif(source, executor=None):
+    """Reads the whole GIF from `source` (see get_reader) and returns its
+    lazy GifInfo with the images of all frames decoded in `executor` at
+    once; a frame is composited when it is first asked for."""
+    data = await get_reader(source).read()
+    gif = GifInfo(data=data, lazy=True)
+    images = await asyncio.gather(*(decode(descriptor, executor)
+                                    for descriptor in gif.image_descriptors))
+    for i, indices in enumerate(images):
+        palette, transparency = gif.images_info[i][1:]
+        gif._images[i] = (indices, palette, transparency)
+    return gif
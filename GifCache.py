@@ -0,0 +1,150 @@
+import hashlib
+import os
+import struct
+import zlib
+from collections import OrderedDict
+from GifInfo import DeltaFrames, GifInfo, Frame
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+CACHE_EXTENSION = '.gifcache'
+# width, height, number of frames, is the canvas of the next frame stored
+HEADER = struct.Struct('<HHI?')
+
+
+class GifCache:
+    """Parsed and composited GIF files kept between opens.
+
+    A file is found by its path, size and modification time, so a changed
+    file is parsed again. The last used files are kept in memory as long as
+    their data, decoded images and frames take at most `max_bytes`. With
+    `directory` the composited frames are also written there (compressed),
+    and a file found there only has to be parsed, not decoded again.
+
+    The cache owns the GifInfo objects it holds: they are dropped (not
+    closed) when evicted and should not be closed by their users. An
+    entry closed anyway is dropped when it is asked for again."""
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.entries = OrderedDict()
+        # the size of every entry when it was added
+        self.sizes = {}
+        self.stored = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def get_key(filename):
+        stat = os.stat(filename)
+        return os.path.abspath(filename), stat.st_size, stat.st_mtime_ns
+
+    @staticmethod
+    def get_size(gif):
+        """Returns the number of bytes held by `gif`."""
+        size = len(gif.data)
+        size += sum(len(image[0]) for image in gif._images if image)
+        if isinstance(gif._frames, DeltaFrames):
+            size += gif._frames.get_size()
+        else:
+            size += sum(len(frame.data) for frame in gif._frames)
+        return size
+
+    def get(self, filename):
+        """Returns the lazy GifInfo of `filename` with the frames it had
+        when it was put, or None if it is not in the cache."""
+        key = GifCache.get_key(filename)
+        if key in self.entries:
+            if not self.entries[key].closed:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            del self.entries[key]
+            del self.sizes[key]
+        if self.directory is None:
+            return None
+        gif = self.load(filename, key)
+        if gif is not None:
+            self.add(key, gif)
+        return gif
+
+    def put(self, filename, gif):
+        """Adds the GifInfo of `filename` to the cache, and writes its
+        composited frames to `directory` unless they are there already."""
+        key = GifCache.get_key(filename)
+        self.add(key, gif)
+        if self.directory is not None and \
+                len(gif._frames) > self.stored.get(key, 0):
+            self.save(key, gif)
+
+    def open(self, filename, **kwargs):
+        """Returns the GifInfo of `filename` with all its frames
+        composited, built with `kwargs` (see GifInfo) on a miss."""
+        gif = self.get(filename)
+        if gif is None:
+            gif = GifInfo(filename, **kwargs)
+        elif len(gif._frames) < len(gif.frames):
+            gif.decode_images(kwargs.get('jobs') or 1,
+                              range(len(gif._frames), len(gif.frames)))
+            gif.get_frame(len(gif.frames) - 1)
+        self.put(filename, gif)
+        return gif
+
+    def add(self, key, gif):
+        self.entries[key] = gif
+        self.entries.move_to_end(key)
+        self.sizes[key] = GifCache.get_size(gif)
+        total = sum(self.sizes.values())
+        for old_key in list(self.entries):
+            if total <= self.max_bytes:
+                break
+            del self.entries[old_key]
+            total -= self.sizes.pop(old_key)
+
+    def get_path(self, key):
+        name = hashlib.sha1(repr(key).encode('utf8')).hexdigest()
+        return os.path.join(self.directory, name + CACHE_EXTENSION)
+
+    def save(self, key, gif):
+        """Writes the frames of `gif` (and the canvas of the next frame if
+        not all of them are composited) to `directory`."""
+        os.makedirs(self.directory, exist_ok=True)
+        base = b''
+        if len(gif._frames) < len(gif.frames):
+            base = gif.compositor.get_base()
+        width, height = gif.compositor.width, gif.compositor.height
+        data = zlib.compress(
+            HEADER.pack(width, height, len(gif._frames), bool(base)) +
+            b''.join(frame.data for frame in gif._frames) + base)
+        path = self.get_path(key)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+        self.stored[key] = len(gif._frames)
+
+    def load(self, filename, key):
+        """Reads the frames of `filename` written by `save`, None if there
+        are none or they can not be read."""
+        try:
+            with open(self.get_path(key), 'rb') as f:
+                data = zlib.decompress(f.read())
+        except (OSError, zlib.error):
+            return None
+        if len(data) < HEADER.size:
+            return None
+        width, height, count, has_base = HEADER.unpack_from(data)
+        frame_size = width * height * 3
+        if len(data) != HEADER.size + (count + has_base) * frame_size:
+            return None
+        gif = GifInfo(filename, lazy=True)
+        if (width, height) != (gif.compositor.width, gif.compositor.height) \
+                or count > len(gif.frames):
+            return None
+        data = memoryview(data)
+        for i in range(count):
+            start = HEADER.size + i * frame_size
+            gif._frames.append(Frame(width, height, bytearray(
+                data[start:start + frame_size])))
+        if has_base:
+            gif.compositor.set_base(data[HEADER.size + count * frame_size:])
+        self.stored[key] = count
+        return gif
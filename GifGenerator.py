@@ -0,0 +1,238 @@
+#!/usr/bin/python3
+import argparse
+import random
+import struct
+
+LZW_MAX_CODES = 4096
+
+
+class GifImage:
+    """An image to write: `indices` are given row by row (also for an
+    interlaced image), `palette` is the local color table (RGB bytes) or
+    None for the global one."""
+    def __init__(self, indices, width, height, left=0, top=0, palette=None,
+                 disposal=0, transparency=None, delay=0, interlaced=False):
+        self.indices = bytes(indices)
+        self.width = width
+        self.height = height
+        self.left = left
+        self.top = top
+        self.palette = palette
+        self.disposal = disposal
+        self.transparency = transparency
+        self.delay = delay
+        self.interlaced = interlaced
+
+
+def encode_lzw(indices, min_code_size, clear_interval=None):
+    """Encodes `indices` with the GIF flavor of LZW.
+
+    The stream starts with a clear code and ends with the end code. The
+    table is cleared when it is full and, with `clear_interval`, after
+    every `clear_interval` codes."""
+    clear_code = 1 << min_code_size
+    end_code = clear_code + 1
+    output = bytearray()
+    accumulator = 0
+    bits = 0
+    code_size = min_code_size + 1
+    table = {}
+    next_code = end_code + 1
+    emitted = 0
+
+    def emit(code):
+        nonlocal accumulator, bits
+        accumulator |= code << bits
+        bits += code_size
+        while bits >= 8:
+            output.append(accumulator & 0xff)
+            accumulator >>= 8
+            bits -= 8
+
+    emit(clear_code)
+    if not indices:
+        emit(end_code)
+        if bits:
+            output.append(accumulator)
+        return bytes(output)
+    prefix = indices[0]
+    for index in indices[1:]:
+        key = prefix << 8 | index
+        code = table.get(key)
+        if code is not None:
+            prefix = code
+            continue
+        emit(prefix)
+        emitted += 1
+        prefix = index
+        if next_code < LZW_MAX_CODES and \
+                (not clear_interval or emitted < clear_interval):
+            table[key] = next_code
+            next_code += 1
+            if next_code > 1 << code_size and code_size < 12:
+                code_size += 1
+            continue
+        # the decoder adds the entry anyway and may read wider codes now
+        if emitted > 1 and next_code >= 1 << code_size and code_size < 12:
+            code_size += 1
+        emit(clear_code)
+        table = {}
+        next_code = end_code + 1
+        code_size = min_code_size + 1
+        emitted = 0
+    emit(prefix)
+    if emitted and next_code >= 1 << code_size and code_size < 12:
+        code_size += 1
+    emit(end_code)
+    if bits:
+        output.append(accumulator)
+    return bytes(output)
+
+
+def get_interlaced(indices, width, height):
+    """Reorders the rows of an image into the interlaced order."""
+    rows = (list(range(0, height, 8)) + list(range(4, height, 8)) +
+            list(range(2, height, 4)) + list(range(1, height, 2)))
+    return b''.join(indices[row * width:(row + 1) * width] for row in rows)
+
+
+def get_table_bits(palette):
+    """Returns the size field of a color table: it holds 2 << bits colors."""
+    colors = max(2, len(palette) // 3)
+    return max(0, (colors - 1).bit_length() - 1)
+
+
+def get_table(palette):
+    return palette.ljust(3 * (2 << get_table_bits(palette)), b'\0')
+
+
+def build_gif(width, height, images, palette=None, clear_interval=None,
+              loop=None, bg_index=0):
+    """Returns the bytes of a GIF89a of `width` x `height` with the
+    GifImages `images`. `palette` is the global color table (RGB bytes),
+    `loop` adds a NETSCAPE extension with that loop count."""
+    data = bytearray(b'GIF89a')
+    packed = 0
+    if palette:
+        packed = 0x80 | get_table_bits(palette)
+    data += struct.pack('<HHBBB', width, height, packed, bg_index, 0)
+    if palette:
+        data += get_table(palette)
+    if loop is not None:
+        data += b'\x21\xff\x0bNETSCAPE2.0'
+        data += struct.pack('<BBHB', 3, 1, loop, 0)
+    encoded = {}
+    for image in images:
+        packed = image.disposal << 2 | (image.transparency is not None)
+        data += struct.pack('<BBBBHBB', 0x21, 0xf9, 4, packed, image.delay,
+                            image.transparency or 0, 0)
+        packed = 0x40 if image.interlaced else 0
+        table = image.palette or palette or b''
+        if image.palette:
+            packed |= 0x80 | get_table_bits(image.palette)
+        data += struct.pack('<BHHHHB', 0x2c, image.left, image.top,
+                            image.width, image.height, packed)
+        if image.palette:
+            data += get_table(image.palette)
+        min_code_size = max(2, get_table_bits(table) + 1)
+        indices = image.indices
+        if image.interlaced:
+            indices = get_interlaced(indices, image.width, image.height)
+        key = (indices, min_code_size)
+        if key not in encoded:
+            encoded.clear()
+            encoded[key] = encode_lzw(indices, min_code_size,
+                                      clear_interval)
+        lzw = encoded[key]
+        data.append(min_code_size)
+        for i in range(0, len(lzw), 255):
+            data.append(len(lzw[i:i + 255]))
+            data += lzw[i:i + 255]
+        data.append(0)
+    data.append(0x3b)
+    return bytes(data)
+
+
+def get_palette(colors, shift=0):
+    """Returns `colors` distinct RGB colors, `shift` rotates them."""
+    return b''.join(bytes(((i + shift) * 37 % 256, (i + shift) * 91 % 256,
+                           i * 157 % 256)) for i in range(colors))
+
+
+def generate_gif(width, height, frames=1, colors=256, local_tables=False,
+                 interlaced=False, disposal=0, transparency=None,
+                 clear_interval=None, noise=False, image_size=None, loop=None,
+                 seed=0):
+    """Returns the bytes of a synthetic animation.
+
+    Frames are diagonal stripes moving by one pixel per frame or, with
+    `noise`, random pixels (which LZW hardly compresses). `disposal` is a
+    disposal method or a list of them used in turn. With `image_size`
+    ((width, height)) the images only cover that part of the canvas and
+    move over it. With `local_tables` every image has its own colors."""
+    randbytes = random.Random(seed).randbytes
+    if isinstance(disposal, int):
+        disposal = [disposal]
+    image_width, image_height = image_size or (width, height)
+    colors_map = bytes(i % colors for i in range(256))
+    stripes = bytes(i % colors for i in range(image_width + image_height +
+                                              frames))
+    images = []
+    for i in range(frames):
+        if noise:
+            indices = randbytes(image_width * image_height).translate(
+                colors_map)
+        else:
+            indices = b''.join(stripes[y + i:y + i + image_width]
+                               for y in range(image_height))
+        left = top = 0
+        if image_size:
+            left = i % (width - image_width + 1)
+            top = i % (height - image_height + 1)
+        images.append(GifImage(
+            indices, image_width, image_height, left, top,
+            get_palette(colors, i) if local_tables else None,
+            disposal[i % len(disposal)], transparency,
+            interlaced=interlaced))
+    return build_gif(width, height, images,
+                     None if local_tables else get_palette(colors),
+                     clear_interval, loop)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Writes a synthetic GIF for tests and benchmarks.')
+    parser.add_argument('filename', type=str)
+    parser.add_argument('-s', '--size', type=str, default='64x64',
+                        help='Canvas size, WIDTHxHEIGHT')
+    parser.add_argument('-n', '--frames', type=int, default=1)
+    parser.add_argument('-c', '--colors', type=int, default=256)
+    parser.add_argument('--image-size', type=str,
+                        help='Size of the images, WIDTHxHEIGHT '
+                             '(default: the canvas)')
+    parser.add_argument('--local-tables', action='store_true')
+    parser.add_argument('--interlaced', action='store_true')
+    parser.add_argument('--disposal', type=int, nargs='+', default=[0])
+    parser.add_argument('--transparency', type=int)
+    parser.add_argument('--clear-interval', type=int,
+                        help='Clear the LZW table after so many codes')
+    parser.add_argument('--noise', action='store_true',
+                        help='Random pixels instead of stripes')
+    parser.add_argument('--loop', type=int,
+                        help='Loop count of a NETSCAPE extension')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    width, height = map(int, args.size.split('x'))
+    image_size = None
+    if args.image_size:
+        image_size = tuple(map(int, args.image_size.split('x')))
+    data = generate_gif(width, height, args.frames, args.colors,
+                        args.local_tables, args.interlaced, args.disposal,
+                        args.transparency, args.clear_interval, args.noise,
+                        image_size, args.loop, args.seed)
+    with open(args.filename, 'wb') as f:
+        f.write(data)
+
+
+if __name__ == '__main__':
+    main()
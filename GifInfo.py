@@ -1,7 +1,20 @@
-import copy
-import codecs
-import math
-import sys
+import base64
+import json
+import mmap
+import os
+import re
+import struct
+import time
+import zlib
+from array import array
+from collections import OrderedDict
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 EXCEPTION_MESSAGES = {3: 'Error: logical screen descriptor is wrong, len < 26',
@@ -17,27 +30,57 @@ EXCEPTION_MESSAGES = {3: 'Error: logical screen descriptor is wrong, len < 26',
                           'extension',
                       14: 'Error: undefined byte',
                       15: 'Error: undefined extension',
-                      16: 'Error: undefined bytes in decode LZW'}
+                      16: 'Error: undefined bytes in decode LZW',
+                      17: 'Error: decode LZW',
+                      18: 'Error: pixels less than it is necessary'}
+LZW_MAX_CODES = 4096
+KEYFRAME_INTERVAL = 16
+FRAME_CACHE_SIZE = 4
+INDEX_EXTENSION = '.gifidx'
+CHUNK_SIZE = 64 * 1024
 
 
-class LogicalScreenDescriptor:
-    def __init__(self, hex_bytes):
-        if len(hex_bytes) < 26:
+class Block:
+    """Base of all parsed blocks.
+
+    A block does not copy its bytes: it keeps the source buffer (bytes or
+    memoryview) and the offset of its first byte, `raw_data` is built
+    from them only when it is printed."""
+    size_block = 0
+
+    def __init__(self, data, offset):
+        self.data = data
+        self.offset = offset
+
+    @property
+    def raw_data(self):
+        return self.data[self.offset:self.offset + self.size_block].hex()
+
+    def check_size(self, size):
+        if self.offset + size > len(self.data):
+            raise ValueError(EXCEPTION_MESSAGES[8])
+
+
+class LogicalScreenDescriptor(Block):
+    def __init__(self, data, offset=0):
+        super().__init__(data, offset)
+        if len(data) - offset < 13:
             raise ValueError(EXCEPTION_MESSAGES[3])
-        self.header = codecs.decode(hex_bytes[:12], 'hex').decode('utf8')
+        self.header = bytes(data[offset:offset + 6]).decode('latin-1')
         if self.header != "GIF89a" and self.header != "GIF87a":
             raise ValueError(EXCEPTION_MESSAGES[4])
-        self.width = GifInfo.swap_pixels(hex_bytes[12:16])
-        self.height = GifInfo.swap_pixels(hex_bytes[16:20])
-        self.packed_fields = bin(int(hex_bytes[20:22], 16))[2:].rjust(8, '0')
-        self.is_global_table = int(self.packed_fields[0])
+        width, height, packed, index_bg_color, ratio = struct.unpack_from(
+            '<HHBBB', data, offset + 6)
+        self.width = '{:04x}'.format(width)
+        self.height = '{:04x}'.format(height)
+        self.packed_fields = '{:08b}'.format(packed)
+        self.is_global_table = packed >> 7
         self.color_resolution = self.packed_fields[1:4]
-        self.is_sorted_pal = int(self.packed_fields[4], 2)
-        self.size_table = int(math.pow(2, int(self.packed_fields[5:8], 2) + 1))
-        self.index_bg_color = hex_bytes[22:24]
-        self.ratio = hex_bytes[24:26]
-        self.size_block = 26
-        self.raw_data = hex_bytes[:26]
+        self.is_sorted_pal = (packed >> 3) & 1
+        self.size_table = 2 << (packed & 7)
+        self.index_bg_color = '{:02x}'.format(index_bg_color)
+        self.ratio = '{:02x}'.format(ratio)
+        self.size_block = 13
 
     def __str__(self):
         return ("\tHeader:{}\n"
@@ -58,45 +101,55 @@ class LogicalScreenDescriptor:
                                     self.ratio))
 
 
-class ColorTable:
-    def __init__(self, hex_bytes, is_table, size_table):
-        self.color_table = []
+class ColorTable(Block):
+    """Colors are decoded once, when the table is parsed: `rgb` is the
+    packed table padded to 256 colors and `channels` are its red, green
+    and blue tables for bytes.translate. `color_table` lists the colors as
+    hex strings for printing."""
+    def __init__(self, data, is_table, size_table, offset=0):
+        super().__init__(data, offset)
+        self.size = 0
         self.size_block = 0
         if is_table:
-            size_global_table = size_table
-            self.color_table = ColorTable._get_colors(hex_bytes,
-                                                      size_global_table)
-            self.size_block += size_global_table * 6
-        self.raw_data = hex_bytes[:self.size_block]
+            self.size = size_table
+            self.size_block = size_table * 3
+            self.check_size(self.size_block)
+        self.rgb = bytes(data[offset:offset + self.size_block]).ljust(
+            256 * 3, b'\0')
+        self.channels = tuple(self.rgb[i::3] for i in range(3))
 
     def __str__(self):
         return "Size of color table:{}".format(self.size_block)
 
+    def __len__(self):
+        return self.size
+
+    @property
+    def color_table(self):
+        return ColorTable._get_colors(self.rgb, 0, self.size)
+
     @staticmethod
-    def _get_colors(hex_bytes, size):
-        start = 0
-        triad_size = 6
-        triads = []
-        for i in range(1, size + 1):
-            triads.append(hex_bytes[start:start + triad_size])
-            start += triad_size
-        return triads
-
-
-class ImageDescriptor:
-    def __init__(self, hex_bytes):
-        self.raw_data = hex_bytes[:20]
-        hex_bytes = hex_bytes[2:]
-        self.left = GifInfo.swap_pixels(hex_bytes[:4])
-        self.top = GifInfo.swap_pixels(hex_bytes[4:8])
-        self.width = GifInfo.swap_pixels(hex_bytes[8:12])
-        self.height = GifInfo.swap_pixels(hex_bytes[12:16])
-        packed_fields = bin(int(hex_bytes[16:18], 16))[2:].rjust(8, '0')
-        self.is_local_table = int(packed_fields[0], 2)
+    def _get_colors(data, offset, size):
+        return [data[i:i + 3].hex()
+                for i in range(offset, offset + size * 3, 3)]
+
+
+class ImageDescriptor(Block):
+    def __init__(self, data, offset=0):
+        super().__init__(data, offset)
+        self.size_block = 10
+        self.check_size(self.size_block)
+        left, top, width, height, packed = struct.unpack_from(
+            '<HHHHB', data, offset + 1)
+        self.left = '{:04x}'.format(left)
+        self.top = '{:04x}'.format(top)
+        self.width = '{:04x}'.format(width)
+        self.height = '{:04x}'.format(height)
+        packed_fields = '{:08b}'.format(packed)
+        self.is_local_table = packed >> 7
         self.is_interplace = packed_fields[1]
         self.is_sorted_pal = packed_fields[2]
-        self.size_local_table = int(math.pow(2, int(packed_fields[5:], 2) + 1))
-        self.size_block = 18
+        self.size_local_table = 2 << (packed & 7)
         self.graphic_block = None
         self.graphic_extension = None
 
@@ -119,32 +172,38 @@ class ImageDescriptor:
                     bool(self.graphic_extension)))
 
 
-class GraphicBlock:
-    def __init__(self, hex_bytes):
-        self.mc = int(hex_bytes[:2], 16)
+class GraphicBlock(Block):
+    """The sub-blocks are only skipped when the block is parsed, by their
+    sizes; `subblocks` collects them when the image is decoded."""
+    def __init__(self, data, offset=0):
+        super().__init__(data, offset)
+        self.check_size(1)
+        self.mc = data[offset]
         if self.mc < 2 or self.mc > 8:
             raise ValueError(EXCEPTION_MESSAGES[5])
-        subblocks_info = GifInfo.get_N_subblocks(hex_bytes)
-        self.subblocks = subblocks_info[0]
-        self.size_block = subblocks_info[1]
-        self.raw_data = hex_bytes[:self.size_block]
-
-
-class GraphicExtension:
-    def __init__(self, hex_bytes):
-        self.raw_data = hex_bytes[:16]
-        hex_bytes = hex_bytes[2:]
-        fixed_size_block = hex_bytes[2:4]
-        if fixed_size_block != '04':
+        self.size_block, count = GifInfo.skip_subblocks(data, offset)
+        # without the MC byte, the size bytes and the terminator
+        self.compressed_size = self.size_block - count - 2
+
+    @property
+    def subblocks(self):
+        return GifInfo.get_N_subblocks(self.data, self.offset)[0]
+
+
+class GraphicExtension(Block):
+    def __init__(self, data, offset=0):
+        super().__init__(data, offset)
+        self.size_block = 8
+        self.check_size(self.size_block)
+        if data[offset + 2] != 4:
             raise ValueError(EXCEPTION_MESSAGES[6])
-        hex_bytes = hex_bytes[4:]
-        packed_fields = bin(int(hex_bytes[:2], 16))[2:].rjust(8, '0')
+        packed, self.delay, self.number_transparency_color = \
+            struct.unpack_from('<BHB', data, offset + 3)
+        packed_fields = '{:08b}'.format(packed)
         self.disposal_method = packed_fields[3:6]
+        self.disposal = (packed >> 2) & 7
         self.user_input = packed_fields[6]
         self.transparency_flag = packed_fields[7]
-        self.delay = int(GifInfo.swap_pixels(hex_bytes[2:6]), 16)
-        self.number_transparency_color = int(hex_bytes[6:8], 16)
-        self.size_block = 14
 
     def __str__(self):
         return ("\tDisposal method:{}\n"
@@ -158,105 +217,481 @@ class GraphicExtension:
                                       self.number_transparency_color))
 
 
-class CommentExtension:
-    def __init__(self, hex_bytes):
-        self.subblock, self.size_block = GifInfo.get_N_subblocks(hex_bytes)
-        self.raw_data = hex_bytes[:self.size_block]
+class CommentExtension(Block):
+    def __init__(self, data, offset=0):
+        super().__init__(data, offset)
+        self.subblock, size_block = GifInfo.get_N_subblocks(data, offset + 1)
+        self.size_block = size_block + 1
 
 
-class ProgramExtension:
-    def __init__(self, hex_bytes):
-        self.raw_data = hex_bytes[:2]
-        hex_bytes = hex_bytes[2:]
-        subblock_size = hex_bytes[2:4]
-        if subblock_size != '0b':
+class ProgramExtension(Block):
+    def __init__(self, data, offset=0):
+        super().__init__(data, offset)
+        self.check_size(14)
+        if data[offset + 2] != 0x0b:
             raise ValueError(EXCEPTION_MESSAGES[10])
-        self.app_id = codecs.decode(hex_bytes[4:20], 'hex').decode('utf8')
-        self.code_id = codecs.decode(hex_bytes[20:26], 'hex').decode('utf8')
+        self.app_id = bytes(data[offset + 3:offset + 11]).decode('utf8')
+        self.code_id = bytes(data[offset + 11:offset + 14]).decode('utf8')
+        self.loop_count = None
         if self.app_id == 'XMP Data':
-            app_info = self.read_xmp_packet(hex_bytes[26:])
+            self.subblock, size_block = self.read_xmp_packet(data,
+                                                             offset + 14)
+            self.size_block = size_block + 14
         elif self.app_id == 'NETSCAPE':
-            app_info = self.process_ext_program_netscape(hex_bytes)
+            app_info = self.process_ext_program_netscape(data, offset)
+            self.subblock, self.size_block = app_info
+            # 0 means forever
+            self.loop_count = int.from_bytes(self.subblock[1:3], 'little')
         else:
             raise ValueError(EXCEPTION_MESSAGES[11])
-        self.subblock, self.size_block = app_info
-        if hex_bytes[self.size_block - 2:self.size_block] != '00':
+        self.check_size(self.size_block)
+        if data[offset + self.size_block - 1] != 0:
             raise ValueError(EXCEPTION_MESSAGES[12])
-        self.raw_data += hex_bytes[:self.size_block]
 
     def __str__(self):
         return ("\tApplication id:{}\n"
                 "\tApplication code:{}".format(self.app_id, self.code_id))
 
     @staticmethod
-    def process_ext_program_netscape(hex_bytes):
-        subblock_size = hex_bytes[26:28]
-        if subblock_size != '03':
+    def process_ext_program_netscape(data, offset=0):
+        if offset + 15 > len(data):
+            raise ValueError(EXCEPTION_MESSAGES[8])
+        subblock_size = data[offset + 14]
+        if subblock_size != 3:
             raise ValueError(EXCEPTION_MESSAGES[13])
-        subblock_end = 28 + int(subblock_size, 16) * 2
-        subblock = hex_bytes[28:subblock_end]
-        size_block = subblock_end + 2
+        subblock_end = offset + 15 + subblock_size
+        subblock = data[offset + 15:subblock_end]
+        size_block = subblock_end + 1 - offset
         return subblock, size_block
 
     @staticmethod
-    def read_xmp_packet(hex_bytes):
-        byte = hex_bytes[:2]
-        start = 2
-        need_byte = 'ff'
-        xmp_packet = ''
+    def read_xmp_packet(data, offset=0):
+        pointer = offset
+        need_byte = 0xff
+        xmp_packet = bytearray()
         while True:
+            if pointer >= len(data):
+                raise ValueError(EXCEPTION_MESSAGES[8])
+            byte = data[pointer]
+            pointer += 1
             if byte == need_byte:
-                need_byte = hex(int(byte, 16) - 1)[2:].rjust(2, '0')
+                need_byte -= 1
             else:
-                xmp_packet += byte
-            if need_byte == '00':
+                xmp_packet.append(byte)
+            if need_byte == 0:
                 break
-            byte = hex_bytes[start:start + 2]
-            start += 2
-        xmp_packet = xmp_packet
-        size_block = start + 30
-        return xmp_packet, size_block
+        size_block = pointer - offset + 2
+        return bytes(xmp_packet), size_block
+
+
+class LazySequence(Sequence):
+    """Read-only sequence which asks `get_item` for an item on access."""
+    def __init__(self, length, get_item):
+        self.length = length
+        self.get_item = get_item
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.length))]
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('Error: index out of range')
+        return self.get_item(index)
+
+    def __iter__(self):
+        for i in range(self.length):
+            yield self.get_item(i)
+
+
+class Frame:
+    """Composited frame: RGB bytes of the logical screen, row by row.
+
+    `dirty` is the (left, top, width, height) rectangle out of which the
+    frame is the same as the previous one, None when it is not known."""
+    def __init__(self, width, height, data=None):
+        self.width = width
+        self.height = height
+        if data is None:
+            data = bytearray(width * height * 3)
+        self.data = data
+        self.dirty = None
+
+    def __eq__(self, other):
+        return (isinstance(other, Frame) and
+                (self.width, self.height) == (other.width, other.height) and
+                self.data == other.data)
+
+    def get_row(self, y):
+        row_size = self.width * 3
+        return memoryview(self.data)[y * row_size:(y + 1) * row_size]
+
+    def get_pixel(self, x, y):
+        start = (y * self.width + x) * 3
+        return tuple(self.data[start:start + 3])
+
+
+class DeltaFrames:
+    """Composited frames kept as changes to the previous frame.
+
+    Every `keyframe_interval`-th frame (and a frame without a `dirty`
+    rectangle) is kept whole, the others only keep the rows of their
+    `dirty` rectangle. A frame is rebuilt from the nearest kept or rebuilt
+    frame before it; the last `cache_size` rebuilt frames are kept, so
+    playing the frames in order rebuilds every one from the previous."""
+    def __init__(self, keyframe_interval=KEYFRAME_INTERVAL,
+                 cache_size=FRAME_CACHE_SIZE):
+        self.keyframe_interval = keyframe_interval
+        self.cache_size = cache_size
+        # a Frame or (rect, rows) for every frame
+        self.entries = []
+        self.cache = OrderedDict()
+        self.stored_bytes = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        for i in range(len(self.entries)):
+            yield self[i]
+
+    def append(self, frame):
+        if frame.dirty is None or \
+                not len(self.entries) % self.keyframe_interval:
+            self.entries.append(Frame(frame.width, frame.height,
+                                      bytearray(frame.data)))
+            self.stored_bytes += len(frame.data)
+        else:
+            rows = Compositor.get_rows(frame, frame.dirty)
+            self.entries.append((frame.dirty, rows))
+            self.stored_bytes += len(rows)
+
+    def get_size(self):
+        """Returns the number of bytes of the kept and rebuilt frames."""
+        return self.stored_bytes + sum(len(frame.data)
+                                       for frame in self.cache.values())
+
+    def __getitem__(self, index):
+        index = range(len(self.entries))[index]
+        if index in self.cache:
+            self.cache.move_to_end(index)
+            return self.cache[index]
+        start = index
+        while start not in self.cache and \
+                not isinstance(self.entries[start], Frame):
+            start -= 1
+        base = self.cache.get(start) or self.entries[start]
+        if start == index:
+            return base
+        frame = Frame(base.width, base.height, bytearray(base.data))
+        for rect, rows in self.entries[start + 1:index + 1]:
+            Compositor.put_rows(frame, rect, rows)
+        frame.dirty = rect
+        self.cache[index] = frame
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return frame
+
+
+class Compositor:
+    """Draws the images of a GIF one by one over the previous frame.
+
+    Only the last frame is kept, so a compositor can be fed from a stream
+    without holding the whole animation. Images are pasted with NumPy when
+    it is installed (unless `use_numpy` is False), and row by row with
+    bytes.translate otherwise.
+
+    Every frame is a copy of the canvas, unless `in_place`: then every
+    image is drawn into the same canvas and `draw` returns the same Frame,
+    valid until the next call. Then a frame only costs its rectangles
+    (but for the first one, which fills the canvas)."""
+    def __init__(self, width, height, bg_color, use_numpy=None,
+                 in_place=False):
+        self.width = width
+        self.height = height
+        self.bg_color = bg_color
+        self.bg_rgb = bytes.fromhex(bg_color)
+        self.frame = None
+        self.disposal = None
+        self.in_place = in_place
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        self.use_numpy = use_numpy
+
+    def draw(self, image, info, disposal=0):
+        """Draws `image` ((indices, palette, transparency), the palette is
+        a ColorTable) at `info` ((left, top, width, height)) and returns the
+        new frame.
+
+        The frame starts as the previous one after the disposal method of
+        the previous image is applied: 0 and 1 leave it as it is, 2 fills
+        the rectangle of the previous image with the background color and
+        3 restores what was under it. Pixels with the transparency index
+        are not drawn. Only the rectangles of the images are touched, the
+        `dirty` rectangle of the frame covers both."""
+        indices, palette, transparency = image
+        left, top, width, height = info
+        if not palette or indices.translate(None, bytes(range(len(palette)))):
+            raise IndexError(EXCEPTION_MESSAGES[18])
+        disposed = self.disposal[0] if self.disposal else None
+        if self.frame:
+            frame = self.frame
+            if not self.in_place:
+                frame = Frame(self.width, self.height,
+                              bytearray(self.frame.data))
+            self.dispose(frame)
+        else:
+            frame = Frame(self.width, self.height,
+                          bytearray(self.bg_rgb) *
+                          (self.width * self.height))
+        see_through = []
+        if transparency is not None:
+            see_through = [transparency]
+        rect = (left, top,
+                max(0, min(width, self.width - left)),
+                max(0, min(height, self.height - top)))
+        self.disposal = None
+        if disposal == 2:
+            self.disposal = (rect, None)
+        elif disposal == 3:
+            self.disposal = (rect, self.get_rows(frame, rect))
+        if self.use_numpy:
+            self.paste_numpy(frame, indices, width, palette, see_through,
+                             rect)
+        else:
+            self.paste(frame, indices, width, palette, see_through, rect)
+        if self.frame:
+            frame.dirty = Compositor.get_union(rect, disposed)
+        self.frame = frame
+        return frame
+
+    def get_base(self):
+        """Returns the canvas the next image will be drawn over (the last
+        frame after its disposal method), None before the first image."""
+        if self.frame is None:
+            return None
+        frame = Frame(self.width, self.height, bytearray(self.frame.data))
+        self.dispose(frame)
+        return bytes(frame.data)
+
+    def set_base(self, data):
+        """Makes the canvas returned by `get_base` the one the next image
+        is drawn over."""
+        self.frame = Frame(self.width, self.height, bytearray(data))
+        self.disposal = None
+
+    def dispose(self, frame):
+        """Applies the disposal method of the previous image to `frame`."""
+        if self.disposal is None:
+            return
+        rect, saved = self.disposal
+        if saved is None:
+            saved = self.bg_rgb * (rect[2] * rect[3])
+        Compositor.put_rows(frame, rect, saved)
+
+    @staticmethod
+    def put_rows(frame, rect, rows):
+        """Copies `rows` (see `get_rows`) into the `rect` part of
+        `frame`."""
+        left, top, width, height = rect
+        row_size = width * 3
+        for y in range(height):
+            start = ((top + y) * frame.width + left) * 3
+            frame.data[start:start + row_size] = \
+                rows[y * row_size:(y + 1) * row_size]
+
+    @staticmethod
+    def get_union(rect, other):
+        """Returns the smallest rectangle which covers `rect` and `other`
+        (which may be None)."""
+        if other is None or not other[2] or not other[3]:
+            return rect
+        if not rect[2] or not rect[3]:
+            return other
+        left = min(rect[0], other[0])
+        top = min(rect[1], other[1])
+        right = max(rect[0] + rect[2], other[0] + other[2])
+        bottom = max(rect[1] + rect[3], other[1] + other[3])
+        return left, top, right - left, bottom - top
+
+    @staticmethod
+    def get_rows(frame, rect):
+        """Returns a copy of the `rect` part of `frame`."""
+        left, top, width, rows = rect
+        row_size = width * 3
+        return b''.join(frame.data[start:start + row_size]
+                        for start in range((top * frame.width + left) * 3,
+                                           (top + rows) * frame.width * 3,
+                                           frame.width * 3))
+
+    @staticmethod
+    def paste(frame, indices, width, palette, see_through, rect):
+        """Pastes the `rect` ((left, top, width, height), clipped to the
+        frame) part of the image of `width` columns into `frame`."""
+        left, top, row_width, rows = rect
+        channels = palette.channels
+        opaque = None
+        if see_through:
+            opaque = re.compile(b'[^' + b''.join(
+                re.escape(bytes([i])) for i in see_through) + b']+')
+        for y in range(rows):
+            row = indices[y * width:y * width + row_width]
+            colors = bytearray(row_width * 3)
+            for i in range(3):
+                colors[i::3] = row.translate(channels[i])
+            start = ((top + y) * frame.width + left) * 3
+            if opaque is None:
+                frame.data[start:start + row_width * 3] = colors
+                continue
+            for run in opaque.finditer(row):
+                run_start = run.start() * 3
+                run_end = run.end() * 3
+                frame.data[start + run_start:start + run_end] = \
+                    colors[run_start:run_end]
+
+    @staticmethod
+    def paste_numpy(frame, indices, width, palette, see_through, rect):
+        """Same as `paste`, with one indexing call for the colors and one
+        masked copy for the pixels which are not see-through."""
+        left, top, row_width, rows = rect
+        canvas = numpy.frombuffer(frame.data, numpy.uint8).reshape(
+            frame.height, frame.width, 3)
+        image = numpy.frombuffer(indices, numpy.uint8)[:rows * width]
+        image = image.reshape(rows, width)[:, :row_width]
+        colors = numpy.frombuffer(palette.rgb, numpy.uint8).reshape(
+            256, 3).take(image, axis=0)
+        region = canvas[top:top + rows, left:left + row_width]
+        if see_through:
+            is_see_through = numpy.zeros(256, bool)
+            is_see_through[see_through] = True
+            numpy.copyto(region, colors,
+                         where=~is_see_through[image][..., None])
+        else:
+            region[...] = colors
+
+
+class Stats:
+    """Timings and counters of the work done on GIF files.
+
+    `times` holds the seconds spent in every phase ('parse', 'lzw',
+    'composite', 'export'), `counts` the bytes and pixels handled and
+    `lzw_times` the seconds spent decoding every image. `progress` is
+    called with the percentage of the work done, at most once per
+    `interval` seconds (and always for 100)."""
+    def __init__(self, progress=None, interval=0.1):
+        self.times = {}
+        self.counts = {}
+        self.lzw_times = {}
+        self.progress = progress
+        self.interval = interval
+        self.last_report = None
+
+    def add(self, phase, seconds, **counts):
+        self.times[phase] = self.times.get(phase, 0) + seconds
+        for name, count in counts.items():
+            self.counts[name] = self.counts.get(name, 0) + count
+
+    @contextmanager
+    def measure(self, phase, **counts):
+        start = time.perf_counter()
+        yield
+        self.add(phase, time.perf_counter() - start, **counts)
+
+    def report(self, percent):
+        if self.progress is None:
+            return
+        now = time.monotonic()
+        if percent < 100 and self.last_report is not None and \
+                now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        self.progress(int(percent))
+
+    def __str__(self):
+        total = sum(self.times.values())
+        lines = ['{:18} {:9.4f}s {:5.1f}%'.format(
+                     phase, seconds, 100 * seconds / total if total else 0)
+                 for phase, seconds in self.times.items()]
+        lines += ['{:18} {}'.format(name, count)
+                  for name, count in self.counts.items()]
+        slowest = sorted(self.lzw_times.items(), key=lambda item: -item[1])
+        lines += ['{:18} {:9.4f}s'.format('lzw of image {}'.format(index),
+                                          seconds)
+                  for index, seconds in slowest[:5]]
+        return '\n'.join(lines)
 
 
 class GifInfo:
-    def __init__(self, filename=None, qtWindow=None):
-        self.images = []
-        self.qtWindow = qtWindow
+    def __init__(self, filename=None, stats=None, lazy=False, jobs=None,
+                 use_mmap=False, data=None, delta_frames=False):
+        """Parses the blocks of the file.
+
+        With `lazy` the constructor only indexes the blocks: a frame is
+        decoded and composited when `frames[i]` (or `get_frame(i)`) is
+        first asked for, and is kept after that. Otherwise all frames are
+        built at once, decoding the graphic blocks in `jobs` processes
+        when `jobs` > 1 (see `decode_images`).
+
+        With `use_mmap` the file is memory-mapped instead of read: blocks
+        are slices of the mapping, so only the pages which are used are
+        loaded and processes reading the same file share them. Call
+        `close` (or use the object as a context manager) when done.
+
+        `data` (bytes) is parsed instead of reading the file.
+
+        With `delta_frames` composited frames are kept as DeltaFrames:
+        whole only every KEYFRAME_INTERVAL frames and as the changed
+        rectangle otherwise, and rebuilt when asked for.
+
+        `stats` (a Stats) collects the timings and reports the progress of
+        the parsing and, when not `lazy`, of decoding the frames."""
+        self.images_info = []
+        self.stats = stats
         self.transp_colors = []
         self.frames_info = []
         self.images_trs = []
 
         self.filename = filename
-        self.hexbytes = ''
-        if filename:
-            self.hexbytes = GifInfo.get_hexbytes(filename)
+        self.closed = False
+        self.mmap = None
+        self.data = memoryview(b'')
+        if data is None and filename and use_mmap:
+            self.mmap = GifInfo.map_file(filename)
+        if self.mmap is not None:
+            self.data = memoryview(self.mmap)
+        elif data is not None:
+            self.data = memoryview(data)
+        elif filename:
+            self.data = memoryview(GifInfo.get_bytes(filename))
+        data = self.data
+        parse_start = time.perf_counter()
         self.pointer = 0
-        self.lsd = LogicalScreenDescriptor(self.hexbytes)
+        self.lsd = LogicalScreenDescriptor(data)
         self.width = self.lsd.width
         self.height = self.lsd.height
         self.pointer += self.lsd.size_block
-        self.gct = ColorTable(self.hexbytes[self.pointer:],
+        self.gct = ColorTable(data,
                               self.lsd.is_global_table,
-                              self.lsd.size_table)
-        self.bg_color = 'ffffff'
-        if self.gct.color_table:
-            self.bg_color = self.gct.color_table[int(self.lsd.index_bg_color,
-                                                     16)]
+                              self.lsd.size_table,
+                              self.pointer)
+        self.bg_color = GifInfo.get_bg_color(self.lsd, self.gct)
         self.pointer += self.gct.size_block
         self.extensions = []
-        next_block = self.hexbytes[self.pointer:self.pointer + 2]
-        self.pointer += 0
         end = False
         self.image_descriptors = []
         self.program_extensions = []
         last_graphic_extension = None
         while not end:
-            if qtWindow:
-                qtWindow.progress_bar.emit(
-                    20 * self.pointer / len(self.hexbytes))
-            if next_block == '21':
-                extension_bytes = self.hexbytes[self.pointer:]
-                extension = GifInfo.process_extension(extension_bytes)
+            if stats:
+                stats.report(20 * self.pointer / len(data))
+            next_block = None
+            if self.pointer < len(data):
+                next_block = data[self.pointer]
+            if next_block == 0x21:
+                extension = GifInfo.process_extension(data, self.pointer)
                 if isinstance(extension, ProgramExtension):
                     self.program_extensions.append(extension)
                 elif isinstance(extension, GraphicExtension):
@@ -265,11 +700,10 @@ class GifInfo:
                     self.extensions.append(extension)
                 else:
                     self.extensions.append(extension)
-                self.pointer += extension.size_block + 2
-            elif next_block == '2c':
-                descriptor_bytes = self.hexbytes[self.pointer:]
-                self.pointer += 2
-                self.last_image_descriptor = ImageDescriptor(descriptor_bytes)
+                self.pointer += extension.size_block
+            elif next_block == 0x2c:
+                self.last_image_descriptor = ImageDescriptor(data,
+                                                             self.pointer)
                 lid = self.last_image_descriptor
                 self.image_descriptors.append(self.last_image_descriptor)
                 self.frames_info.append((lid.left,
@@ -278,13 +712,12 @@ class GifInfo:
                                          lid.height))
                 self.pointer += self.last_image_descriptor.size_block
                 self.last_loc_table = ColorTable(
-                    self.hexbytes[self.pointer:],
+                    data,
                     self.last_image_descriptor.is_local_table,
-                    self.last_image_descriptor.size_local_table)
+                    self.last_image_descriptor.size_local_table,
+                    self.pointer)
                 self.pointer += self.last_loc_table.size_block
-                if self.pointer > len(self.hexbytes):
-                    raise ValueError(EXCEPTION_MESSAGES[8])
-                self.graphic_block = GraphicBlock(self.hexbytes[self.pointer:])
+                self.graphic_block = GraphicBlock(data, self.pointer)
                 self.last_image_descriptor.graphic_block = self.graphic_block
                 transparency_color = None
                 if last_graphic_extension:
@@ -294,188 +727,686 @@ class GifInfo:
                         transparency_color = lge.number_transparency_color
                     last_graphic_extension = None
                 self.pointer += self.graphic_block.size_block
-                need_pal = self.gct.color_table
+                need_pal = self.gct
                 self.last_image_descriptor.lct = None
                 if self.last_image_descriptor.is_local_table:
-                    need_pal = self.last_loc_table.color_table
+                    need_pal = self.last_loc_table
                     self.last_image_descriptor.lct = self.last_loc_table
-                to_append = (GifInfo.decode_lzw(self.graphic_block.subblocks,
-                                                self.graphic_block.mc + 1),
-                             need_pal,
-                             transparency_color)
-                self.images.append(to_append)
-            elif next_block == '3b':
+                self.images_info.append((self.graphic_block,
+                                         need_pal,
+                                         transparency_color))
+            elif next_block == 0x3b:
                 end = True
             else:
                 raise ValueError(EXCEPTION_MESSAGES[9])
-            next_block = self.hexbytes[self.pointer:self.pointer + 2]
-            self.pointer += 0
-        try:
-            self.frames = self.get_all_frames()
-        except IndexError:
-            raise IndexError('Error: pixels less than it is necessary')
+        if stats:
+            stats.add('parse', time.perf_counter() - parse_start,
+                      bytes=self.pointer + 1)
+        self._images = [None] * len(self.images_info)
+        self._frames = DeltaFrames() if delta_frames else []
+        # DeltaFrames copies what it keeps of a frame
+        self.compositor = Compositor(int(self.width, 16),
+                                     int(self.height, 16),
+                                     self.bg_color, in_place=delta_frames)
+        self.images = LazySequence(len(self.images_info), self.get_image)
+        self.frames = LazySequence(len(self.images_info), self.get_frame)
+        if not lazy:
+            if jobs and jobs > 1:
+                self.decode_images(jobs)
+            for i in range(len(self.frames)):
+                self.get_frame(i)
+                if stats:
+                    stats.report(20 + 80 * (i + 1) / len(self.frames))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Releases the file data. A memory-mapped file is unmapped once
+        the blocks parsed from it are no longer referenced."""
+        self.closed = True
+        self.data.release()
+        if self.mmap is not None:
+            try:
+                self.mmap.close()
+            except BufferError:
+                pass
+            self.mmap = None
 
     @staticmethod
-    def get_N_subblocks(hex_bytes):
+    def get_N_subblocks(data, offset=0):
+        """Collects the data sub-blocks which follow the byte at `offset`.
+
+        Returns the list of zero-copy slices of `data` and the size of the
+        whole block counted from `offset`, terminator included."""
         subblocks = []
-        sb_size = int(hex_bytes[2:4], 16)
-        sb_start = 4
-        while int(hex_bytes[sb_start + sb_size * 2:sb_start + sb_size * 2 + 2],
-                  16) != 0:
-            subblock = hex_bytes[sb_start:sb_start + 255 * 2]
-            subblocks.append(subblock)
-            sb_start += sb_size * 2
-            sb_size = int(hex_bytes[sb_start:sb_start + 2], 16)
-            sb_start += 2
-        else:
-            subblock = hex_bytes[sb_start:sb_start + sb_size * 2]
-            subblocks.append(subblock)
-            sb_start += sb_size * 2
-        if hex_bytes[sb_start:sb_start + 2] != '00':
-            raise ValueError(EXCEPTION_MESSAGES[14])
-        sb_start += 2
-        size_block = sb_start
+        pointer = offset + 1
+        while True:
+            if pointer >= len(data):
+                raise ValueError(EXCEPTION_MESSAGES[8])
+            sb_size = data[pointer]
+            pointer += 1
+            if not sb_size:
+                break
+            if pointer + sb_size > len(data):
+                raise ValueError(EXCEPTION_MESSAGES[8])
+            subblocks.append(data[pointer:pointer + sb_size])
+            pointer += sb_size
+        size_block = pointer - offset
         return subblocks, size_block
 
     @staticmethod
-    def process_extension(hex_bytes):
-        extension_type = hex_bytes[2:4]
-        if extension_type == 'f9':
-            return GraphicExtension(hex_bytes[:16])
-        elif extension_type == 'ff':
-            return ProgramExtension(hex_bytes)
-        elif extension_type == 'fe':
-            return CommentExtension(hex_bytes[2:])
+    def skip_subblocks(data, offset=0):
+        """Same as `get_N_subblocks`, but only returns the size of the
+        block and the number of the sub-blocks."""
+        count = 0
+        pointer = offset + 1
+        while True:
+            if pointer >= len(data):
+                raise ValueError(EXCEPTION_MESSAGES[8])
+            sb_size = data[pointer]
+            if not sb_size:
+                return pointer + 1 - offset, count
+            count += 1
+            pointer += sb_size + 1
+
+    @staticmethod
+    def process_extension(data, offset=0):
+        if offset + 1 >= len(data):
+            raise ValueError(EXCEPTION_MESSAGES[8])
+        extension_type = data[offset + 1]
+        if extension_type == 0xf9:
+            return GraphicExtension(data, offset)
+        elif extension_type == 0xff:
+            return ProgramExtension(data, offset)
+        elif extension_type == 0xfe:
+            return CommentExtension(data, offset)
         else:
             raise ValueError(EXCEPTION_MESSAGES[15])
 
+    def get_image(self, index):
+        """Returns (indices, palette, transparency) of the image `index`,
+        decoding its graphic block on the first call."""
+        if self._images[index] is None:
+            palette, transparency = self.images_info[index][1:]
+            args = GifInfo.get_lzw_args(self.image_descriptors[index])
+            start = time.perf_counter()
+            indices = GifInfo.decode_lzw(*args)
+            if self.stats:
+                seconds = time.perf_counter() - start
+                self.stats.lzw_times[index] = seconds
+                self.stats.add('lzw', seconds, pixels=len(indices),
+                               compressed_bytes=self.images_info[index][0]
+                               .compressed_size)
+            self._images[index] = (indices, palette, transparency)
+        return self._images[index]
+
+    def decode_images(self, jobs, indices=None):
+        """Decodes the graphic blocks of `indices` (all images by default)
+        which are not decoded yet in a pool of `jobs` processes.
+
+        Images do not depend on each other, only compositing does, so
+        `get_frame` then only has to draw the decoded images in order."""
+        if indices is None:
+            indices = range(len(self.images_info))
+        indices = [i for i in indices if self._images[i] is None]
+        if len(indices) < 2 or jobs < 2:
+            for i in indices:
+                self.get_image(i)
+            return
+        args = []
+        for i in indices:
+            lzw_code, *other_args = GifInfo.get_lzw_args(
+                self.image_descriptors[i])
+            args.append([[bytes(subblock) for subblock in lzw_code]] +
+                        other_args)
+        measure = nullcontext()
+        if self.stats:
+            measure = self.stats.measure(
+                'lzw', pixels=sum(image_args[2] for image_args in args),
+                compressed_bytes=sum(self.images_info[i][0].compressed_size
+                                     for i in indices))
+        with measure, ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = executor.map(GifInfo.decode_lzw, *zip(*args))
+            for i, result in zip(indices, results):
+                palette, transparency = self.images_info[i][1:]
+                self._images[i] = (result, palette, transparency)
+
+    @staticmethod
+    def get_lzw_args(descriptor):
+        """Returns the arguments of `decode_lzw` for an image descriptor
+        with its graphic block."""
+        width = int(descriptor.width, 16)
+        height = int(descriptor.height, 16)
+        interlaced_width = width if descriptor.is_interplace == '1' else 0
+        return (descriptor.graphic_block.subblocks,
+                descriptor.graphic_block.mc + 1,
+                width * height,
+                interlaced_width)
+
+    def get_frame(self, index):
+        """Returns the composited frame `index`.
+
+        A frame is drawn over the previous one, so the frames before it
+        which have not been composited yet are composited first."""
+        try:
+            while len(self._frames) <= index:
+                self._frames.append(self.composite_frame(len(self._frames)))
+        except IndexError:
+            raise IndexError(EXCEPTION_MESSAGES[18])
+        return self._frames[index]
+
     def get_all_frames(self):
-        frames = [[]]
-        image = self.images[0]
-        info = [int(e, 16) for e in self.frames_info[0]]
-        width = info[2]
-        height = info[3]
-        pixels_count = width * height
-        for i in range(height):
-            frames[0].append([])
-            for j in range(width):
-                frames[0][i].append(image[1][image[0][i * width + j]])
-        prev_width = width
-        pixel_index = 0
-        for i in range(1, len(self.images)):
-            frames.append([])
-            image = self.images[i]
-            info = [int(e, 16) for e in self.frames_info[i]]
-            left = info[0]
-            top = info[1]
-            width = info[2]
-            height = info[3]
-            frames[i].append([])
-            y = 0
-            x = 0
-            o_i = 0
-            for j in range(pixels_count):
-                if (x < left or
-                        y < top or
-                        x >= width + left or
-                        y >= height + top):
-                    frames[i][y].append(frames[i - 1][y][x])
-                else:
-                    if (self.bg_color == image[1][image[0][o_i]] or
-                            (image[2] and
-                             image[1][image[0][o_i]] == image[1][image[2]])):
-                        frames[i][y].append(frames[i - 1][y][x])
-                    else:
-                        frames[i][y].append(image[1][image[0][o_i]])
-                    o_i += 1
-                x += 1
-                if x == prev_width:
-                    if j == pixels_count - 1:
-                        break
-                    frames[i].append([])
-                    y += 1
-                    x = 0
-                pixel_index += 1
-            if self.qtWindow:
-                self.qtWindow.progress_bar.emit(
-                    20 + 10 * pixel_index / (pixels_count * len(self.images)))
-
-        return frames
+        return self.frames[:]
+
+    def composite_frame(self, index):
+        info = [int(e, 16) for e in self.frames_info[index]]
+        graphic_extension = self.image_descriptors[index].graphic_extension
+        disposal = graphic_extension.disposal if graphic_extension else 0
+        image = self.get_image(index)
+        start = time.perf_counter()
+        frame = self.compositor.draw(image, info, disposal)
+        if self.stats:
+            self.stats.add('composite', time.perf_counter() - start,
+                           composited_pixels=info[2] * info[3])
+        return frame
+
+    @staticmethod
+    def get_bg_color(lsd, gct):
+        if gct:
+            return gct.color_table[int(lsd.index_bg_color, 16)]
+        return 'ffffff'
+
+    @staticmethod
+    def iter_frames(source, copy=True):
+        """Yields (frame, graphic_extension) for every image of the GIF.
+
+        `source` is a file name or a binary file object. Blocks are parsed
+        as their chunks are read and only the previous frame is kept, so
+        memory does not grow with the length of the animation.
+        `graphic_extension` is None when the image has no Graphic Control
+        Extension. Without `copy` the images are drawn in place (see
+        Compositor): every frame is the same object, valid until the next
+        one is yielded, and costs only the rectangles that change."""
+        if isinstance(source, str):
+            with open(source, 'rb') as f:
+                yield from GifInfo.iter_frames(f, copy)
+            return
+        blocks = GifInfo.read_blocks(source)
+        lsd = next(blocks)
+        gct = next(blocks)
+        compositor = Compositor(int(lsd.width, 16), int(lsd.height, 16),
+                                GifInfo.get_bg_color(lsd, gct),
+                                in_place=not copy)
+        for block in blocks:
+            if isinstance(block, ImageDescriptor):
+                frame = GifInfo.draw_image(compositor, block, gct)
+                yield frame, block.graphic_extension
+
+    @staticmethod
+    def draw_image(compositor, descriptor, gct, indices=None):
+        """Decodes the image of `descriptor` (with `lct`, `graphic_block`
+        and `graphic_extension` set), unless its `indices` are given, and
+        draws it with `compositor`."""
+        graphic_extension = descriptor.graphic_extension
+        transparency_color = None
+        disposal = 0
+        if graphic_extension:
+            if graphic_extension.transparency_flag == '1':
+                transparency_color = \
+                    graphic_extension.number_transparency_color
+            disposal = graphic_extension.disposal
+        palette = gct
+        if descriptor.lct:
+            palette = descriptor.lct
+        info = [int(e, 16) for e in (descriptor.left, descriptor.top,
+                                     descriptor.width, descriptor.height)]
+        if indices is None:
+            indices = GifInfo.decode_lzw(*GifInfo.get_lzw_args(descriptor))
+        return compositor.draw((indices, palette, transparency_color),
+                               info, disposal)
 
     @staticmethod
-    def swap_pixels(bytes):
-        return bytes[-2:] + bytes[:2]
+    def read_blocks(f):
+        """Reads the blocks of the GIF file object `f` in chunks.
+
+        Yields the logical screen descriptor, the global color table and
+        then the extensions and the image descriptors (see
+        IncrementalParser) in file order, up to the trailer. Every block
+        is read into its own bytes object."""
+        parser = IncrementalParser(composite=False)
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            for kind, block in parser.feed(chunk):
+                if kind == 'end':
+                    return
+                yield block
+        parser.close()
 
     @staticmethod
-    def get_hexbytes(filename):
+    def get_bytes(filename):
         with open(filename, 'rb') as f:
-            return f.read().hex()
+            return f.read()
 
     @staticmethod
-    def initialize_lzw_dict(min_len):
-        lzw_dict = {}
-        end_dict = int(math.pow(2, min_len - 1))
-        for i in range(end_dict):
-            lzw_dict[i] = [i]
-        lzw_dict[end_dict] = 'clear'
-        lzw_dict[end_dict + 1] = 'end'
-        return lzw_dict
+    def map_file(filename):
+        """Returns a read-only mapping of the file, None if it is empty
+        (an empty file can not be mapped)."""
+        with open(filename, 'rb') as f:
+            if not os.fstat(f.fileno()).st_size:
+                return None
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
 
     @staticmethod
-    def initialize_lzw(lzw_code, min_len):
-        lzw_code = ''.join(lzw_code)
-        lzw_dict = {}
-        end_dict = int(math.pow(2, min_len - 1))
-        for i in range(end_dict):
-            lzw_dict[i] = [i]
-        lzw_dict[end_dict] = 'clear'
-        lzw_dict[end_dict + 1] = 'end'
-        end_code = end_dict + 1
-        end_dict += 2
-        lzw_code_list = []
-        for i in range(0, len(lzw_code), 2):
-            to_append = bin(int(lzw_code[i:i + 2], 16))[2:].rjust(8, '0')
-            lzw_code_list.append(to_append)
-        lzw_code_list = lzw_code_list[::-1]
-        lzw_code_str = ''.join(lzw_code_list)
-        start = len(lzw_code_str)
-        if lzw_code_str[start - min_len:start] != bin(end_dict - 2)[2:]:
-            sys.exit(1)
-        return lzw_dict, lzw_code_str, end_code
+    def get_interlaced_rows(width, size):
+        """Returns the offsets in the image of the rows of an interlaced
+        image, in the order they are stored: every 8th row from 0, every
+        8th row from 4, every 4th row from 2 and every 2nd row from 1."""
+        height = size // width
+        order = (list(range(0, height, 8)) + list(range(4, height, 8)) +
+                 list(range(2, height, 4)) + list(range(1, height, 2)))
+        return [row * width for row in order]
 
     @staticmethod
-    def decode_lzw(lzw_code, min_len):
-        start_min_len = min_len
-        lzw_dict, lzw_code_str, end_code = GifInfo.initialize_lzw(lzw_code,
-                                                                  min_len)
-        start = len(lzw_code_str) - min_len
-        result = []
-        previous = int(lzw_code_str[start - min_len:start], 2)
-        result.extend(copy.copy(lzw_dict[previous]))
-        start -= min_len
-        while (int(lzw_code_str[start - min_len:start], 2) != end_code and
-               start > min_len):
-            input_code = int(lzw_code_str[start - min_len:start], 2)
-            if input_code == end_code - 1:
-                lzw_dict = GifInfo.initialize_lzw_dict(start_min_len)
-                start -= min_len
-                min_len = start_min_len
-                previous = int(lzw_code_str[start - min_len:start], 2)
-                result.extend(copy.copy(lzw_dict[previous]))
-                start -= min_len
-                continue
-            to_add = copy.copy(lzw_dict[previous])
-            if input_code in lzw_dict:
-                result.extend(lzw_dict[input_code])
-                to_add.append(lzw_dict[input_code][0])
+    def decode_lzw(lzw_code, min_len, size, interlaced_width=0):
+        """Decodes the LZW sub-blocks into a bytearray of `size` indices.
+
+        `lzw_code` is the list of sub-blocks (any buffers), they are not
+        joined: every sub-block is added to a bit accumulator as a whole
+        and the codes are taken from it. `min_len` is the starting code
+        size (MC + 1). A code of the table is stored as the offset and the
+        length of its string in the already decoded output: the string of a
+        new code is the previous string plus the next byte, and both of
+        them already lie side by side in the result.
+
+        For an interlaced image `interlaced_width` is its width: the rows
+        are then written straight to their places in the image, offsets of
+        the table stay offsets in the decoding order."""
+        result = bytearray(size)
+        rows = None
+        if interlaced_width:
+            rows = GifInfo.get_interlaced_rows(interlaced_width, size)
+
+        def read(pointer, length):
+            string = bytearray()
+            while length:
+                row, column = divmod(pointer, interlaced_width)
+                part = min(length, interlaced_width - column)
+                start = rows[row] + column
+                string += result[start:start + part]
+                pointer += part
+                length -= part
+            return string
+
+        def write(pointer, string):
+            while string:
+                row, column = divmod(pointer, interlaced_width)
+                part = min(len(string), interlaced_width - column)
+                start = rows[row] + column
+                result[start:start + part] = string[:part]
+                pointer += part
+                string = string[part:]
+
+        offsets = array('L', [0]) * LZW_MAX_CODES
+        lengths = array('H', [0]) * LZW_MAX_CODES
+        clear_code = 1 << (min_len - 1)
+        end_code = clear_code + 1
+        next_code = end_code + 1
+        code_size = min_len
+        code_mask = (1 << code_size) - 1
+        accumulator = 0
+        bits = 0
+        pointer = 0
+        prev_pointer = 0
+        prev_length = 0
+        for subblock in lzw_code:
+            accumulator |= int.from_bytes(subblock, 'little') << bits
+            bits += len(subblock) * 8
+            while bits >= code_size:
+                code = accumulator & code_mask
+                accumulator >>= code_size
+                bits -= code_size
+                if code == clear_code:
+                    next_code = end_code + 1
+                    code_size = min_len
+                    code_mask = (1 << code_size) - 1
+                    prev_length = 0
+                    continue
+                if code == end_code:
+                    raise IndexError(EXCEPTION_MESSAGES[18])
+                if code < clear_code:
+                    length = 1
+                    string = code.to_bytes(1, 'little')
+                elif end_code < code < next_code:
+                    start = offsets[code]
+                    length = lengths[code]
+                    if rows:
+                        string = read(start, length)
+                    else:
+                        string = result[start:start + length]
+                elif code == next_code and prev_length:
+                    length = prev_length + 1
+                    if rows:
+                        string = read(prev_pointer, prev_length)
+                    else:
+                        string = result[prev_pointer:
+                                        prev_pointer + prev_length]
+                    string.append(string[0])
+                else:
+                    raise KeyError(code)
+                if pointer + length >= size:
+                    string = string[:size - pointer]
+                    if rows:
+                        write(pointer, string)
+                    else:
+                        result[pointer:] = string
+                    return result
+                if rows:
+                    write(pointer, string)
+                else:
+                    result[pointer:pointer + length] = string
+                if prev_length and next_code < LZW_MAX_CODES:
+                    offsets[next_code] = prev_pointer
+                    lengths[next_code] = prev_length + 1
+                    next_code += 1
+                    if next_code > code_mask and code_size < 12:
+                        code_size += 1
+                        code_mask = (1 << code_size) - 1
+                prev_pointer = pointer
+                prev_length = length
+                pointer += length
+        raise ValueError(EXCEPTION_MESSAGES[16])
+
+
+class IncrementalParser:
+    """Parses a GIF pushed to it in chunks of any size, as they arrive.
+
+    `feed` keeps the bytes of an incomplete block until the rest of it
+    comes and returns the events of the blocks completed so far, in file
+    order, as (kind, value):
+
+        ('header', LogicalScreenDescriptor)
+        ('color_table', ColorTable) - the global table (empty if none)
+        ('extension', GraphicExtension, ProgramExtension or CommentExtension)
+        ('image', ImageDescriptor) - with `lct`, `graphic_block` and
+            `graphic_extension` (None if it has none) set
+        ('frame', Frame) - the composited frame of the image of the
+            previous event, with `composite` only
+        ('end', None) - the trailer, bytes after it are ignored
+
+    Call `close` when the data ends: it raises if the trailer was not
+    reached. Broken blocks raise the errors of GifInfo; the events of the
+    blocks before a broken one are returned first and the error is raised
+    by the next call. Every block is copied into its own bytes object
+    once it is complete, and a block is scanned only once however it is
+    split into chunks. `position` is the number of bytes parsed."""
+    def __init__(self, composite=True):
+        self.composite = composite
+        self.buffer = bytearray()
+        # offset of the next sub-block size of the block in the buffer
+        self.scan = None
+        self.position = 0
+        self.lsd = None
+        self.gct = None
+        self.compositor = None
+        self.last_graphic_extension = None
+        self.error = None
+        self.done = False
+
+    def feed(self, chunk):
+        if self.error is not None:
+            raise self.error
+        if self.done:
+            return []
+        self.buffer += chunk
+        events = []
+        try:
+            while not self.done:
+                size = self.get_block_size()
+                if size is None:
+                    break
+                block = bytes(self.buffer[:size])
+                del self.buffer[:size]
+                self.position += size
+                self.scan = None
+                events += self.parse_block(block)
+        except (ValueError, KeyError, IndexError) as e:
+            self.error = e
+            if not events:
+                raise
+        return events
+
+    def close(self):
+        if self.error is not None:
+            raise self.error
+        if self.done:
+            return
+        if self.lsd is None:
+            LogicalScreenDescriptor(bytes(self.buffer))
+        if self.gct is not None and not self.buffer:
+            raise ValueError(EXCEPTION_MESSAGES[9])
+        raise ValueError(EXCEPTION_MESSAGES[8])
+
+    def get_block_size(self):
+        """Returns the size of the next block when all of it is in the
+        buffer, None otherwise."""
+        buffer = self.buffer
+        if self.lsd is None:
+            return 13 if len(buffer) >= 13 else None
+        if self.gct is None:
+            size = self.lsd.size_table * 3 if self.lsd.is_global_table else 0
+            return size if len(buffer) >= size else None
+        if not buffer:
+            return None
+        if self.scan is None:
+            if buffer[0] == 0x3b:
+                return 1
+            # the fixed fields are checked as soon as they arrive, so a
+            # broken block is not buffered up to the end of the data
+            elif buffer[0] == 0x21:
+                if len(buffer) < 2:
+                    return None
+                if buffer[1] not in (0xf9, 0xff, 0xfe):
+                    raise ValueError(EXCEPTION_MESSAGES[15])
+                if buffer[1] == 0xf9:
+                    if len(buffer) < 3:
+                        return None
+                    if buffer[2] != 4:
+                        raise ValueError(EXCEPTION_MESSAGES[6])
+                self.scan = 2
+            elif buffer[0] == 0x2c:
+                if len(buffer) < 10:
+                    return None
+                # the descriptor, the local table and the LZW code size
+                scan = 11
+                if buffer[9] & 0x80:
+                    scan += 3 * (2 << (buffer[9] & 7))
+                if len(buffer) < scan:
+                    return None
+                if not 2 <= buffer[scan - 1] <= 8:
+                    raise ValueError(EXCEPTION_MESSAGES[5])
+                self.scan = scan
+            else:
+                raise ValueError(EXCEPTION_MESSAGES[9])
+        pointer = self.scan
+        while pointer < len(buffer):
+            if not buffer[pointer]:
+                return pointer + 1
+            pointer += buffer[pointer] + 1
+        self.scan = pointer
+        return None
+
+    def parse_block(self, block):
+        """Returns the events of a complete block."""
+        if self.lsd is None:
+            self.lsd = LogicalScreenDescriptor(block)
+            return [('header', self.lsd)]
+        if self.gct is None:
+            self.gct = ColorTable(block, self.lsd.is_global_table,
+                                  self.lsd.size_table)
+            if self.composite:
+                self.compositor = Compositor(
+                    int(self.lsd.width, 16), int(self.lsd.height, 16),
+                    GifInfo.get_bg_color(self.lsd, self.gct))
+            return [('color_table', self.gct)]
+        if block[0] == 0x21:
+            extension = GifInfo.process_extension(block)
+            if isinstance(extension, GraphicExtension) and \
+                    self.lsd.header == "GIF89a":
+                self.last_graphic_extension = extension
+            return [('extension', extension)]
+        if block[0] == 0x2c:
+            descriptor = ImageDescriptor(block)
+            offset = descriptor.size_block
+            descriptor.lct = None
+            if descriptor.is_local_table:
+                descriptor.lct = ColorTable(block, True,
+                                            descriptor.size_local_table,
+                                            offset)
+                offset += descriptor.lct.size_block
+            descriptor.graphic_block = GraphicBlock(block, offset)
+            descriptor.graphic_extension = self.last_graphic_extension
+            self.last_graphic_extension = None
+            events = [('image', descriptor)]
+            if self.composite:
+                events.append(('frame', GifInfo.draw_image(
+                    self.compositor, descriptor, self.gct)))
+            return events
+        self.done = True
+        return [('end', None)]
+
+
+class GifIndex:
+    """Offsets of the blocks of every image of a GIF file.
+
+    `frames[i]` is (image descriptor, graphic extension, local color
+    table, graphic block) offsets of the image `i`, None for the blocks it
+    does not have. `keyframes` maps an image index to the canvas it is
+    drawn over (see `Compositor.get_base`); one is kept every
+    `keyframe_interval` images when frames are composited, so `get_frame`
+    replays at most that many images. The index can be saved next to the
+    file (`save`) and loaded back without parsing it again (`load`)."""
+    def __init__(self, frames, keyframes=None,
+                 keyframe_interval=KEYFRAME_INTERVAL):
+        self.frames = frames
+        self.keyframes = keyframes if keyframes is not None else {}
+        self.keyframe_interval = keyframe_interval
+
+    def __len__(self):
+        return len(self.frames)
+
+    @staticmethod
+    def build(data):
+        """Walks the blocks of `data` and records their offsets.
+
+        Graphic blocks are skipped by the sizes of their sub-blocks,
+        nothing is decoded."""
+        lsd = LogicalScreenDescriptor(data)
+        pointer = lsd.size_block
+        if lsd.is_global_table:
+            pointer += lsd.size_table * 3
+        frames = []
+        last_graphic_extension = None
+        while True:
+            next_block = None
+            if pointer < len(data):
+                next_block = data[pointer]
+            if next_block == 0x21:
+                extension = GifInfo.process_extension(data, pointer)
+                if isinstance(extension, GraphicExtension) and \
+                        lsd.header == "GIF89a":
+                    last_graphic_extension = pointer
+                pointer += extension.size_block
+            elif next_block == 0x2c:
+                descriptor = ImageDescriptor(data, pointer)
+                descriptor_offset = pointer
+                pointer += descriptor.size_block
+                lct = None
+                if descriptor.is_local_table:
+                    lct = pointer
+                    pointer += descriptor.size_local_table * 3
+                frames.append((descriptor_offset, last_graphic_extension,
+                               lct, pointer))
+                last_graphic_extension = None
+                pointer += GraphicBlock(data, pointer).size_block
+            elif next_block == 0x3b:
+                return GifIndex(frames)
             else:
-                to_add.append(lzw_dict[previous][0])
-                result.extend(to_add)
-            lzw_dict[len(lzw_dict)] = copy.copy(to_add)
-            previous = input_code
-            start -= min_len
-            if not (len(lzw_dict) & (len(lzw_dict) - 1)) and min_len < 12:
-                min_len += 1
-            if start < min_len:
-                raise ValueError(EXCEPTION_MESSAGES[16])
-        return result
+                raise ValueError(EXCEPTION_MESSAGES[9])
+
+    def get_descriptor(self, data, index):
+        """Parses the blocks of the image `index` at their offsets and
+        returns its descriptor with `lct`, `graphic_block` and
+        `graphic_extension` set."""
+        descriptor_offset, extension, lct, graphic_block = self.frames[index]
+        descriptor = ImageDescriptor(data, descriptor_offset)
+        descriptor.lct = None
+        if lct is not None:
+            descriptor.lct = ColorTable(data, True,
+                                        descriptor.size_local_table, lct)
+        if extension is not None:
+            descriptor.graphic_extension = GraphicExtension(data, extension)
+        descriptor.graphic_block = GraphicBlock(data, graphic_block)
+        return descriptor
+
+    def get_frame(self, data, index):
+        """Returns the composited frame `index` of the GIF `data`.
+
+        Compositing starts from the nearest keyframe at or before `index`,
+        and the keyframes passed on the way are added to the index."""
+        lsd = LogicalScreenDescriptor(data)
+        gct = ColorTable(data, lsd.is_global_table, lsd.size_table,
+                         lsd.size_block)
+        compositor = Compositor(int(lsd.width, 16), int(lsd.height, 16),
+                                GifInfo.get_bg_color(lsd, gct), in_place=True)
+        index = range(len(self.frames))[index]
+        start = max((i for i in self.keyframes if i <= index), default=0)
+        if start:
+            compositor.set_base(self.keyframes[start])
+        try:
+            for i in range(start, index + 1):
+                if i and i % self.keyframe_interval == 0:
+                    self.keyframes.setdefault(i, compositor.get_base())
+                frame = GifInfo.draw_image(
+                    compositor, self.get_descriptor(data, i), gct)
+        except IndexError:
+            raise IndexError(EXCEPTION_MESSAGES[18])
+        return frame
+
+    def save(self, filename):
+        """Writes the index of the GIF `filename` next to it.
+
+        The size and the modification time of the file are stored too, so
+        `load` ignores the index once the file is changed."""
+        stat = os.stat(filename)
+        keyframes = {str(i): base64.b64encode(
+                         zlib.compress(keyframe)).decode('ascii')
+                     for i, keyframe in self.keyframes.items()}
+        with open(filename + INDEX_EXTENSION, 'w') as f:
+            json.dump({'size': stat.st_size,
+                       'mtime': stat.st_mtime_ns,
+                       'keyframe_interval': self.keyframe_interval,
+                       'frames': self.frames,
+                       'keyframes': keyframes}, f)
+
+    @staticmethod
+    def load(filename):
+        """Returns the index saved for the GIF `filename`, or None if there
+        is none, it is out of date or it is damaged."""
+        try:
+            with open(filename + INDEX_EXTENSION) as f:
+                index = json.load(f)
+            stat = os.stat(filename)
+            if index.get('size') != stat.st_size or \
+                    index.get('mtime') != stat.st_mtime_ns:
+                return None
+            keyframes = {int(i): zlib.decompress(base64.b64decode(keyframe))
+                         for i, keyframe in index['keyframes'].items()}
+            frames = [tuple(offsets) for offsets in index['frames']]
+            keyframe_interval = index['keyframe_interval']
+        except (OSError, ValueError, zlib.error, KeyError, TypeError,
+                AttributeError):
+            return None
+        return GifIndex(frames, keyframes, keyframe_interval)
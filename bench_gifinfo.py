@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+import argparse
+import glob
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import GifGenerator
+import GifInfo
+from PIL import Image
+
+PHASES = ['parse', 'lzw', 'composite', 'export']
+DEFAULT_FILES = 'test_suite/good/*.gif'
+# differences smaller than this (seconds) are noise, not regressions
+MIN_DIFFERENCE = 0.002
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Times parsing, LZW decoding, compositing and export '
+                    'of GIF files.')
+    parser.add_argument('files', nargs='*',
+                        help='GIF files (default: {})'.format(DEFAULT_FILES))
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Runs of every phase, the best one is kept')
+    parser.add_argument('-o', '--output', type=str,
+                        help='Write the results to this JSON file')
+    parser.add_argument('-b', '--baseline', type=str,
+                        help='Compare with the results of a previous run')
+    parser.add_argument('-t', '--threshold', type=float, default=0.1,
+                        help='Slowdown relative to the baseline which is a '
+                             'regression (default 0.1 = 10%%)')
+    parser.add_argument('--no-memory', action='store_false', dest='memory',
+                        help='Do not trace the peak memory (tracing makes '
+                             'a run several times slower)')
+    parser.add_argument('-g', '--generate', action='append', default=[],
+                        metavar='WIDTHxHEIGHTxFRAMES',
+                        help='Also time a synthetic GIF of this size '
+                             '(see GifGenerator.py)')
+    args = parser.parse_args()
+    files = args.files
+    if not files and not args.generate:
+        files = sorted(glob.glob(DEFAULT_FILES))
+    files = {filename: filename for filename in files}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.generate:
+            files['generated:' + size] = generate_file(directory, size)
+        results = bench_files(files, args.repeat, args.memory)
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for filename, phase, old, new in regressions:
+            print('Regression: {} {}: {:.4f}s -> {:.4f}s'.format(
+                filename, phase, old, new))
+        if regressions:
+            sys.exit(1)
+
+
+def generate_file(directory, size):
+    """Writes a synthetic GIF of `size` ('WIDTHxHEIGHTxFRAMES') into
+    `directory` and returns its name."""
+    width, height, frames = map(int, size.split('x'))
+    filename = os.path.join(directory, size + '.gif')
+    with open(filename, 'wb') as f:
+        f.write(GifGenerator.generate_gif(width, height, frames))
+    return filename
+
+
+def bench_files(files, repeat=3, memory=True):
+    """`files` maps the names to show to the file names."""
+    return {'numpy': GifInfo.numpy is not None,
+            'python': sys.version.split()[0],
+            'files': {name: bench_file(filename, repeat, memory)
+                      for name, filename in files.items()}}
+
+
+def bench_file(filename, repeat=3, memory=True):
+    """Returns the best time of every phase for `filename`, the number of
+    frames and (with `memory`) the peak of traced memory of a whole run,
+    measured in a separate run."""
+    result = {phase: float('inf') for phase in PHASES}
+    for _ in range(repeat):
+        for phase, seconds in run_phases(filename).items():
+            result[phase] = min(result[phase], seconds)
+    if memory:
+        tracemalloc.start()
+        try:
+            run_phases(filename)
+            result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    result['frames'] = len(GifInfo.GifInfo(filename, lazy=True).frames)
+    return result
+
+
+def run_phases(filename):
+    """Runs the phases one after another, returns their times."""
+    times = {}
+    start = time.perf_counter()
+    gif = GifInfo.GifInfo(filename, lazy=True)
+    times['parse'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    images = [gif.get_image(i) for i in range(len(gif.images))]
+    times['lzw'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    frames = [gif.get_frame(i) for i in range(len(images))]
+    times['composite'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for frame in frames:
+        img = Image.frombuffer('RGB', (frame.width, frame.height),
+                               frame.data, 'raw', 'RGB', 0, 1)
+        img.save(io.BytesIO(), 'bmp')
+    times['export'] = time.perf_counter() - start
+    return times
+
+
+def compare(results, baseline, threshold=0.1):
+    """Returns (file, phase, baseline time, time) of the phases which are
+    slower than in `baseline` by more than `threshold` (a fraction)."""
+    regressions = []
+    for filename, result in results['files'].items():
+        old_result = baseline['files'].get(filename)
+        if old_result is None:
+            continue
+        for phase in PHASES:
+            old, new = old_result.get(phase), result[phase]
+            if old is None:
+                continue
+            if new > old * (1 + threshold) and new - old > MIN_DIFFERENCE:
+                regressions.append((filename, phase, old, new))
+    return regressions
+
+
+def print_results(results):
+    print('{:40} {:>7}'.format('file', 'frames') +
+          ''.join('{:>11}'.format(phase) for phase in PHASES) +
+          '{:>12}'.format('peak KiB'))
+    for filename, result in results['files'].items():
+        peak_memory = '-'
+        if 'peak_memory' in result:
+            peak_memory = result['peak_memory'] // 1024
+        print('{:40} {:>7}'.format(filename, result['frames']) +
+              ''.join('{:>10.4f}s'.format(result[phase])
+                      for phase in PHASES) +
+              '{:>12}'.format(peak_memory))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,42 +1,356 @@
 #!/usr/bin/python3
 import argparse
+import cProfile
+import csv
+import GifCache
 import GifInfo
-import textwrap
+import glob
+import json
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from contextlib import nullcontext
+from itertools import islice, repeat
 from PIL import Image
 
 DESCRIPTION_TYPES = ['raw_data', 'deciphered_data', 'rgb_data']
+FRAME_FORMATS = ['bmp', 'png', 'ppm']
+SCAN_FORMATS = ['csv', 'jsonl']
+# files being scanned or waiting to be written, per worker process
+SCAN_WINDOW = 4
+FILE_FIELDS = ['file', 'exit_code', 'error', 'file_size', 'version', 'width',
+               'height', 'frames', 'loop_count', 'global_table_size',
+               'local_tables', 'compressed_size', 'duration']
+FRAME_FIELDS = ['file', 'frame', 'left', 'top', 'width', 'height', 'delay',
+                'disposal', 'transparency_index', 'local_table_size',
+                'interlaced', 'compressed_size']
 
 
 def main():
+    if sys.argv[1:2] == ['scan']:
+        sys.exit(scan(sys.argv[2:]))
     parser = argparse.ArgumentParser(
         formatter_class=argparse.RawTextHelpFormatter
     )
     group = parser.add_mutually_exclusive_group(required=True)
-    parser.add_argument('filename', type=str, help='Name of gif file')
+    parser.add_argument('filename', type=str,
+                        help='Name of gif file.\n'
+                             'A directory or a glob pattern converts all '
+                             'its files (batch mode, --bmp only)')
     group.add_argument('-b', '--bmp', type=str, dest='bmp_arg',
                        help='Create bmp frames in [filename] directory')
+    parser.add_argument('-f', '--format', choices=FRAME_FORMATS,
+                        default='bmp', dest='frame_format',
+                        help='Format of the frames created by --bmp')
     group.add_argument('description', type=str, nargs='?',
                        help='Print gif description.\n'
                             'Types:\n\t%s' % '\n\t'.join(DESCRIPTION_TYPES))
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='Number of worker processes: files in batch '
+                             'mode (default: number of CPUs), frames to '
+                             'decode otherwise (default: 1)')
+    parser.add_argument('-c', '--cache', type=str, dest='cache_dir',
+                        help='Directory to keep the frames of converted '
+                             'files in, so they are not decoded again')
+    parser.add_argument('--json', action='store_true',
+                        help='Print the description as JSON')
+    parser.add_argument('--profile', action='store_true',
+                        help='Print the time spent in every phase and the '
+                             'bytes and pixels handled')
+    parser.add_argument('--cprofile', type=str, metavar='FILE',
+                        help='Write cProfile statistics to FILE')
     args = parser.parse_args()
+    filenames = get_batch_files(args.filename)
+    if filenames == []:
+        print('Error: no gif files match {}'.format(args.filename),
+              file=sys.stderr)
+        sys.exit(2)
+    if filenames is not None:
+        if not args.bmp_arg:
+            print('Error: batch mode supports only --bmp', file=sys.stderr)
+            sys.exit(2)
+        if args.profile or args.cprofile:
+            print('Error: batch mode does not support profiling',
+                  file=sys.stderr)
+            sys.exit(2)
+        sys.exit(convert_batch(filenames, args.bmp_arg,
+                               args.jobs or os.cpu_count(),
+                               args.frame_format, args.cache_dir))
+    stats = GifInfo.Stats() if args.profile else None
+    profiler = cProfile.Profile() if args.cprofile else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        process_file(args, stats)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.cprofile)
+        if stats is not None:
+            print('Profile:\n{}'.format(stats), file=sys.stderr)
+
+
+def process_file(args, stats=None):
     try:
         if args.description:
-            print_gif_objects(args.filename, args.description)
+            print_gif_objects(args.filename, args.description, stats,
+                              args.json)
         if args.bmp_arg:
-            create_bmp_frames(args.filename, args.bmp_arg)
+            create_bmp_frames(args.filename, args.bmp_arg, args.jobs or 1,
+                              args.frame_format, args.cache_dir, stats)
     except ValueError as e:
         print(str(e), file=sys.stderr)
-        sys.exit(int(str(e)))
+        sys.exit(get_exit_code(e))
     except KeyError:
-        print('Error: decode LZW', file=sys.stderr)
+        print(GifInfo.EXCEPTION_MESSAGES[17], file=sys.stderr)
         sys.exit(17)
     except IndexError as e:
         print(e, file=sys.stderr)
         sys.exit(18)
 
 
+def get_exit_code(exception):
+    """Returns the exit code (see README) of an exception of GifInfo."""
+    if isinstance(exception, KeyError):
+        return 17
+    if isinstance(exception, IndexError):
+        return 18
+    for code, message in GifInfo.EXCEPTION_MESSAGES.items():
+        if str(exception) == message:
+            return code
+    return 1
+
+
+def get_batch_files(pattern):
+    """Returns the gif files of a directory or a glob pattern, or None if
+    `pattern` is a single file name."""
+    batch_pattern = get_batch_pattern(pattern)
+    if batch_pattern is None:
+        return None
+    return sorted(glob.glob(batch_pattern))
+
+
+def get_batch_pattern(pattern):
+    """Returns the glob pattern of the gif files of a directory or a glob
+    pattern, or None if `pattern` is a single file name (an existing file
+    is never taken for a pattern, even with '[', '*' or '?' in its
+    name)."""
+    if os.path.isfile(pattern):
+        return None
+    if os.path.isdir(pattern):
+        return os.path.join(glob.escape(pattern), '*.gif')
+    if glob.has_magic(pattern):
+        return pattern
+    return None
+
+
+def convert_file(filename, arg, frame_format='bmp', cache_dir=None):
+    """Worker of the batch mode: returns (filename, exit code)."""
+    try:
+        create_bmp_frames(filename, arg, frame_format=frame_format,
+                          cache_dir=cache_dir)
+    except (OSError, ValueError, KeyError, IndexError) as e:
+        return filename, 1 if isinstance(e, OSError) else get_exit_code(e)
+    except SystemExit as e:
+        return filename, e.code
+    return filename, 0
+
+
+def convert_batch(filenames, arg, jobs, frame_format='bmp', cache_dir=None):
+    """Converts `filenames` in `jobs` processes and prints a summary.
+
+    Returns 0 if every file was converted, 1 otherwise."""
+    if jobs > 1 and len(filenames) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(convert_file, filenames,
+                                        repeat(arg), repeat(frame_format),
+                                        repeat(cache_dir)))
+    else:
+        results = [convert_file(filename, arg, frame_format, cache_dir)
+                   for filename in filenames]
+    failed = {}
+    for filename, code in results:
+        if code:
+            failed.setdefault(code, []).append(filename)
+    print('Converted: {}/{}'.format(len(results) - sum(map(len,
+                                                           failed.values())),
+                                    len(results)))
+    for code in sorted(failed):
+        message = GifInfo.EXCEPTION_MESSAGES.get(code)
+        description = ' ({})'.format(message) if message else ''
+        print('Exit code {}{}: {}'.format(code, description,
+                                          len(failed[code])))
+        for filename in failed[code]:
+            print('    {}'.format(filename))
+    return 1 if failed else 0
+
+
+def scan(argv):
+    """The scan subcommand: writes the metadata of many files, one row per
+    file and one row per frame. Returns the exit code."""
+    parser = argparse.ArgumentParser(
+        prog='cmain.py scan',
+        description='Write the metadata of gif files (one row per file and '
+                    'one row per frame) without decoding them.')
+    parser.add_argument('files', nargs='+',
+                        help='Gif files, directories or glob patterns')
+    parser.add_argument('-o', '--output', type=str,
+                        help='File for the rows of files (default: stdout)')
+    parser.add_argument('--frames-output', type=str,
+                        help='File for the rows of frames. Without it jsonl '
+                             'writes them to --output, csv skips them')
+    parser.add_argument('-f', '--format', choices=SCAN_FORMATS,
+                        help='Format of the rows (default: by the extension '
+                             'of --output, else csv)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='Number of worker processes')
+    args = parser.parse_args(argv)
+    scan_format = args.format
+    if scan_format is None:
+        scan_format = 'jsonl' if args.output and \
+            args.output.endswith('.jsonl') else 'csv'
+    unmatched = []
+    filenames = iter_scan_files(args.files, unmatched)
+    scanned = failed = 0
+    with open_output(args.output) as output, \
+            open_output(args.frames_output, args.frames_output is None) \
+            as frames_output:
+        file_writer = get_writer(output, scan_format, FILE_FIELDS, 'file')
+        frame_writer = None
+        if args.frames_output:
+            frame_writer = get_writer(frames_output, scan_format,
+                                      FRAME_FIELDS, 'frame')
+        elif scan_format == 'jsonl':
+            frame_writer = get_writer(output, scan_format, FRAME_FIELDS,
+                                      'frame')
+        for file_row, frame_rows in scan_files(filenames, args.jobs):
+            file_writer(file_row)
+            if frame_writer is not None:
+                for frame_row in frame_rows:
+                    frame_writer(frame_row)
+            scanned += 1
+            failed += file_row['exit_code'] != 0
+    print('Scanned: {}/{}'.format(scanned - failed, scanned),
+          file=sys.stderr)
+    if unmatched:
+        return 2
+    return 1 if failed else 0
+
+
+def iter_scan_files(patterns, unmatched):
+    """Yields the files of `patterns` (see get_batch_pattern) one by one,
+    the files of a directory or a glob pattern in the order the file
+    system lists them. Patterns which match no files are reported and
+    added to `unmatched`."""
+    for pattern in patterns:
+        batch_pattern = get_batch_pattern(pattern)
+        if batch_pattern is None:
+            yield pattern
+            continue
+        matched = False
+        for filename in glob.iglob(batch_pattern):
+            matched = True
+            yield filename
+        if not matched:
+            print('Error: no gif files match {}'.format(pattern),
+                  file=sys.stderr)
+            unmatched.append(pattern)
+
+
+def open_output(filename, skip=False):
+    """Opens `filename` for the rows, stdout if it is None."""
+    if skip:
+        return nullcontext()
+    if filename is None:
+        return nullcontext(sys.stdout)
+    return open(filename, 'w', newline='')
+
+
+def get_writer(output, scan_format, fields, kind):
+    """Returns a function writing one row (a dict with `fields`) at once."""
+    if scan_format == 'csv':
+        writer = csv.DictWriter(output, fields)
+        writer.writeheader()
+        return writer.writerow
+
+    def write_json(row):
+        output.write(json.dumps(dict(row, type=kind)) + '\n')
+    return write_json
+
+
+def scan_files(filenames, jobs=1):
+    """Yields the rows of the files of the iterable `filenames` (see
+    scan_file) in their order, as soon as they are scanned.
+
+    Only SCAN_WINDOW * `jobs` files are taken from `filenames` ahead of
+    the rows being yielded, so memory does not grow with the number of
+    files."""
+    if jobs < 2:
+        yield from map(scan_file, filenames)
+        return
+    filenames = iter(filenames)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = deque(executor.submit(scan_file, filename)
+                        for filename in islice(filenames, SCAN_WINDOW * jobs))
+        while pending:
+            result = pending.popleft().result()
+            for filename in islice(filenames, 1):
+                pending.append(executor.submit(scan_file, filename))
+            yield result
+
+
+def scan_file(filename):
+    """Worker of the scan subcommand: returns the row of `filename` and the
+    rows of its frames. The graphic blocks are skipped, not decoded."""
+    file_row = dict.fromkeys(FILE_FIELDS, '')
+    file_row.update(file=filename, exit_code=0)
+    frame_rows = []
+    try:
+        file_row['file_size'] = os.path.getsize(filename)
+        with GifInfo.GifInfo(filename, lazy=True, use_mmap=True) as gif:
+            lsd = gif.lsd
+            loop_counts = [ext.loop_count for ext in gif.program_extensions
+                           if ext.loop_count is not None]
+            for i, descr in enumerate(gif.image_descriptors):
+                extension = descr.graphic_extension
+                frame_rows.append({
+                    'file': filename,
+                    'frame': i + 1,
+                    'left': int(descr.left, 16),
+                    'top': int(descr.top, 16),
+                    'width': int(descr.width, 16),
+                    'height': int(descr.height, 16),
+                    'delay': extension.delay if extension else '',
+                    'disposal': extension.disposal if extension else '',
+                    'transparency_index':
+                        extension.number_transparency_color
+                        if extension and extension.transparency_flag == '1'
+                        else '',
+                    'local_table_size':
+                        descr.size_local_table if descr.is_local_table else 0,
+                    'interlaced': int(descr.is_interplace),
+                    'compressed_size': descr.graphic_block.compressed_size})
+            file_row.update(
+                version=lsd.header,
+                width=int(lsd.width, 16),
+                height=int(lsd.height, 16),
+                frames=len(frame_rows),
+                loop_count=loop_counts[0] if loop_counts else '',
+                global_table_size=lsd.size_table if lsd.is_global_table
+                else 0,
+                local_tables=sum(row['local_table_size'] > 0
+                                 for row in frame_rows),
+                compressed_size=sum(row['compressed_size']
+                                    for row in frame_rows),
+                duration=sum(row['delay'] or 0 for row in frame_rows))
+    except (OSError, ValueError, KeyError, IndexError) as e:
+        file_row.update(exit_code=1 if isinstance(e, OSError)
+                        else get_exit_code(e), error=str(e))
+        frame_rows = []
+    return file_row, frame_rows
+
+
 def print_raw_data(gif):
     print('Logical Screen Descriptor:\n    {}\n'.format(gif.lsd.raw_data))
     for i in gif.program_extensions:
@@ -70,47 +384,119 @@ def print_deciphered_data(gif):
 
 def print_rgb_data(gif):
     print(' Global Color Table:', end='\n    ')
-    rgb = gif.gct.raw_data
-    if rgb:
-        print(' '.join([rgb[i:i + 6] for i in range(0, len(rgb), 6)]))
+    if gif.gct:
+        print(' '.join(gif.gct.color_table))
         print()
     else:
         print('    empty\n')
     for counter, descr in enumerate(gif.image_descriptors):
         if descr.lct:
             print(' Local Color Table of Frame {}:'.format(counter), end='\n')
-            rgb = descr.lct.raw_data
-            print(' '.join([rgb[i:i + 6] for i in range(0, len(rgb), 6)]))
+            print(' '.join(descr.lct.color_table))
         print()
 
 
-def print_gif_objects(filename, descr_type):
+def print_gif_objects(filename, descr_type, stats=None, as_json=False):
+    """Prints the blocks of the file. Graphic blocks are only skipped, not
+    decoded."""
     if descr_type not in DESCRIPTION_TYPES:
         print('Error: undefined type of description', file=sys.stderr)
         return
-    gif = GifInfo.GifInfo(filename)
+    with GifInfo.GifInfo(filename, stats, lazy=True, use_mmap=True) as gif:
+        if as_json:
+            print(json.dumps(get_description(gif, descr_type), indent=2))
+        elif descr_type == 'raw_data':
+            print_raw_data(gif)
+        elif descr_type == 'deciphered_data':
+            print_deciphered_data(gif)
+        elif descr_type == 'rgb_data':
+            print_rgb_data(gif)
+
+
+def get_description(gif, descr_type):
+    """Returns the description of `descr_type` for --json."""
+    if descr_type == 'rgb_data':
+        return {'global_color_table': gif.gct.color_table,
+                'local_color_tables': {
+                    counter: descr.lct.color_table
+                    for counter, descr in enumerate(gif.image_descriptors)
+                    if descr.lct}}
     if descr_type == 'raw_data':
-        print_raw_data(gif)
-    elif descr_type == 'deciphered_data':
-        print_deciphered_data(gif)
-    elif descr_type == 'rgb_data':
-        print_rgb_data(gif)
+        return {'logical_screen_descriptor': gif.lsd.raw_data,
+                'program_extensions': [{'app_id': ext.app_id,
+                                        'raw_data': ext.raw_data}
+                                       for ext in gif.program_extensions],
+                'frames': [{'image_descriptor': descr.raw_data,
+                            'graphic_extension':
+                                descr.graphic_extension.raw_data
+                                if descr.graphic_extension else None,
+                            'graphic_block': descr.graphic_block.raw_data}
+                           for descr in gif.image_descriptors]}
+    lsd = gif.lsd
+    frames = []
+    for descr in gif.image_descriptors:
+        frame = {'left': int(descr.left, 16),
+                 'top': int(descr.top, 16),
+                 'width': int(descr.width, 16),
+                 'height': int(descr.height, 16),
+                 'local_table': bool(descr.is_local_table),
+                 'interlaced': descr.is_interplace == '1',
+                 'sorted': descr.is_sorted_pal == '1',
+                 'local_table_size': descr.size_local_table,
+                 'compressed_size': descr.graphic_block.compressed_size,
+                 'graphic_extension': None}
+        extension = descr.graphic_extension
+        if extension:
+            frame['graphic_extension'] = {
+                'disposal': extension.disposal,
+                'user_input': extension.user_input == '1',
+                'transparency': extension.transparency_flag == '1',
+                'transparency_index': extension.number_transparency_color,
+                'delay': extension.delay}
+        frames.append(frame)
+    return {'logical_screen_descriptor': {
+                'header': lsd.header,
+                'width': int(lsd.width, 16),
+                'height': int(lsd.height, 16),
+                'global_table': bool(lsd.is_global_table),
+                'color_resolution': lsd.color_resolution,
+                'sorted': bool(lsd.is_sorted_pal),
+                'global_table_size': lsd.size_table,
+                'bg_index': int(lsd.index_bg_color, 16),
+                'ratio': int(lsd.ratio, 16)},
+            'program_extensions': [{'app_id': ext.app_id,
+                                    'app_code': ext.code_id}
+                                   for ext in gif.program_extensions],
+            'frames': frames}
 
 
-def create_bmp_frames(filename, arg):
-    gif = GifInfo.GifInfo(filename)
-    directory = get_not_existed_dir(filename)
-    start, end = get_segment_of_frames(arg, len(gif.frames))
+def create_bmp_frames(filename, arg, jobs=1, frame_format='bmp',
+                      cache_dir=None, stats=None):
+    cache = gif = None
+    if cache_dir:
+        cache = GifCache.GifCache(directory=cache_dir)
+        gif = cache.get(filename)
+    if gif is None:
+        gif = GifInfo.GifInfo(filename, stats, lazy=True, use_mmap=True)
+    gif.stats = stats
+    # a gif put into the cache is owned by it and is not closed
+    with gif if cache is None else nullcontext():
+        directory = get_not_existed_dir(filename)
+        start, end = get_segment_of_frames(arg, len(gif.frames))
+        gif.decode_images(jobs, range(len(gif._frames), end))
+        gif.get_frame(end - 1)
+        if cache is not None:
+            cache.put(filename, gif)
     os.mkdir(directory)  # get_not_existed_dir выбирает имя директории
-    for x in range(start, end):
-        size = (int(gif.width, 16), int(gif.height, 16))
-        img = Image.new('RGB', size, "white")
-        pixels = img.load()
-        for i in range(img.size[0]):
-            for j in range(img.size[1]):
-                rgb = textwrap.wrap(gif.frames[x][j][i], 2)
-                pixels[i, j] = tuple(map(lambda z: int(z, 16), rgb))
-        img.save('{}/{}.bmp'.format(directory, x + 1))
+    measure = nullcontext()
+    if stats is not None:
+        measure = stats.measure('export', exported_frames=end - start)
+    with measure:
+        for x in range(start, end):
+            frame = gif.frames[x]
+            img = Image.frombuffer('RGB', (frame.width, frame.height),
+                                   frame.data, 'raw', 'RGB', 0, 1)
+            img.save('{}/{}.{}'.format(directory, x + 1, frame_format))
     print('Directory: {}'.format(directory))
 
 
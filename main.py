@@ -4,9 +4,12 @@ from PyQt5.QtWidgets import QApplication, QFrame, QAction, QMainWindow, \
     QMessageBox
 from PyQt5.QtGui import QColor, QPalette, QImage, QPixmap
 from PyQt5.QtCore import QTimer, QThread, pyqtSignal, Qt
+import GifCache
 import GifInfo
 import os
 
+CACHE = GifCache.GifCache()
+
 
 class CentralWidget(QWidget):
     def __init__(self, parent):
@@ -53,10 +56,10 @@ class SomeThread(QThread):
 
     def run(self):
         try:
-            gifinfo = GifInfo.GifInfo(self.fname, self.o)
-            self.o.pbar.setValue(30)
+            stats = GifInfo.Stats(self.o.progress_bar.emit)
+            gifinfo = CACHE.open(self.fname, stats=stats)
             self.o.gifinfo = gifinfo
-            self.o.frames = self.o.get_all_pixmaps()
+            self.o.frames = [None] * len(gifinfo.frames)
             self.o.loaded_signal.emit()
         except KeyError:
             self.o.exception_signal.emit(Exception('Error: LZW decode'))
@@ -285,31 +288,16 @@ class Widget(QMainWindow):
 
     def paintEvent(self, event):
         super().paintEvent(event)
-        self.img.setPixmap(self.frames[self.gif_id])
-
-    def get_all_pixmaps(self):
-        result = []
-        count = len(self.gifinfo.frames)
-        all_percents = 70
-        z = 0
-        all = int(self.gifinfo.height, 16) * count
-        for t in self.gifinfo.frames:
-            frame = QImage(int(self.gifinfo.width, 16),
-                           int(self.gifinfo.height, 16),
-                           QImage.Format_RGB32)
-            y = 0
-            for i in t:
-                x = 0
-                for j in i:
-                    frame.setPixelColor(x, y, QColor('#' + j))
-                    x += 1
-                y += 1
-
-                z += 1
-                self.progress_bar.emit(all_percents * z / all + 30)
-            result.append(QPixmap(frame))
-            self.progress_bar.emit(all_percents * z / all + 30)
-        return result
+        self.img.setPixmap(self.get_pixmap(self.gif_id))
+
+    def get_pixmap(self, index):
+        """Converts the frame to a pixmap when it is first shown."""
+        if self.frames[index] is None:
+            frame = self.gifinfo.frames[index]
+            image = QImage(bytes(frame.data), frame.width, frame.height,
+                           frame.width * 3, QImage.Format_RGB888)
+            self.frames[index] = QPixmap.fromImage(image)
+        return self.frames[index]
 
 
 if __name__ == '__main__':
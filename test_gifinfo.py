@@ -1,11 +1,48 @@
 import unittest
+import asyncio
+import csv
+import json
 import os
+import random
+import re
+import shutil
 import sys
+import tempfile
 from io import StringIO
 from GifInfo import *
+import GifInfo as gifinfo_module
+from GifCache import GifCache
+import GifAsync
+import GifGenerator
+import bench_gifinfo
 import cmain
 
 
+WHITE, RED, GREEN, BLUE = range(4)
+PALETTE = bytes.fromhex('ffffff' 'ff0000' '00ff00' '0000ff')
+
+
+def build_gif(width, height, images):
+    """Builds a GIF with PALETTE as the global table from
+    (left, top, width, height, indices, disposal, transparency) images.
+
+    The LZW table is cleared before every second code, so the codes
+    always take 3 bits."""
+    return GifGenerator.build_gif(width, height, [
+        GifGenerator.GifImage(indices, w, h, left, top, disposal=disposal,
+                              transparency=transparency)
+        for left, top, w, h, indices, disposal, transparency in images],
+        PALETTE, clear_interval=2)
+
+
+def write_gif(test, data):
+    f = tempfile.NamedTemporaryFile(suffix='.gif', delete=False)
+    test.addCleanup(os.remove, f.name)
+    with f:
+        f.write(data)
+    return f.name
+
+
 class CmainTest(unittest.TestCase):
     def test_main_errors(self):
         sys.argv[1:] = ['-d', 'raw', 'test_suite/bad/ce77.gif']
@@ -38,6 +75,159 @@ class CmainTest(unittest.TestCase):
         os.remove('test_suite/good/10x10/1.bmp')
         os.rmdir('test_suite/good/10x10')
 
+    def test_main_create_png(self):
+        sys.argv[1:] = ['--bmp', '2', '--format', 'png',
+                        'test_suite/good/10x10.gif']
+        self.assertFalse(os.path.exists('test_suite/good/10x10'))
+        cmain.main()
+        self.addCleanup(shutil.rmtree, 'test_suite/good/10x10')
+        gif = GifInfo('test_suite/good/10x10.gif')
+        with cmain.Image.open('test_suite/good/10x10/2.png') as img:
+            self.assertEqual(img.tobytes(), gif.frames[1].data)
+
+    def test_main_single_file_without_pool(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        shutil.copy('test_suite/good/3.gif', directory)
+
+        def no_pool(*args, **kwargs):
+            raise AssertionError('process pool started')
+        self.addCleanup(setattr, gifinfo_module, 'ProcessPoolExecutor',
+                        gifinfo_module.ProcessPoolExecutor)
+        gifinfo_module.ProcessPoolExecutor = no_pool
+        sys.argv[1:] = ['--bmp', ':', directory + '/3.gif']
+        cmain.main()
+        self.assertTrue(os.path.isfile(directory + '/3/2.bmp'))
+
+    def test_main_batch(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for name in ['good/10x10.gif', 'good/4x4.gif', 'bad/0646.gif']:
+            shutil.copy('test_suite/' + name, directory)
+        sys.argv[1:] = ['--bmp', ':', '--jobs', '2', directory]
+        out = StringIO()
+        sys.stdout = out
+        with self.assertRaises(SystemExit) as e:
+            cmain.main()
+        sys.stdout = sys.__stdout__
+        self.assertEqual(e.exception.code, 1)
+        self.assertIn('Converted: 2/3', out.getvalue())
+        self.assertIn('Exit code 9', out.getvalue())
+        self.assertTrue(os.path.isfile(directory + '/10x10/2.bmp'))
+        self.assertTrue(os.path.isfile(directory + '/4x4/2.bmp'))
+        self.assertFalse(os.path.exists(directory + '/0646'))
+
+    def test_main_batch_with_unreadable_entries(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        shutil.copy('test_suite/good/4x4.gif', directory)
+        os.symlink(directory + '/missing.gif', directory + '/broken.gif')
+        os.mkdir(directory + '/dir.gif')
+        for jobs in ['1', '2']:
+            sys.argv[1:] = ['--bmp', ':', '--jobs', jobs, directory]
+            out = StringIO()
+            sys.stdout = out
+            with self.assertRaises(SystemExit) as e:
+                cmain.main()
+            sys.stdout = sys.__stdout__
+            self.assertEqual(e.exception.code, 1)
+            self.assertIn('Converted: 1/3', out.getvalue())
+            self.assertIn('Exit code 1', out.getvalue())
+
+    def test_main_file_name_like_pattern(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        filename = os.path.join(directory, 'a[1].gif')
+        shutil.copy('test_suite/good/4x4.gif', filename)
+        self.assertIsNone(cmain.get_batch_files(filename))
+        sys.argv[1:] = ['--bmp', '1', filename]
+        sys.stdout = StringIO()
+        try:
+            cmain.main()
+        finally:
+            sys.stdout = sys.__stdout__
+        self.assertTrue(os.path.isfile(directory + '/a[1]/1.bmp'))
+        sys.argv[1:] = ['--bmp', '1', os.path.join(directory, '*.png')]
+        sys.stderr = StringIO()
+        try:
+            with self.assertRaises(SystemExit) as e:
+                cmain.main()
+        finally:
+            sys.stderr = sys.__stderr__
+        self.assertEqual(e.exception.code, 2)
+
+    def test_main_scan(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for name in ['good/10x10.gif', 'good/sample_1.gif', 'bad/0646.gif']:
+            shutil.copy('test_suite/' + name, directory)
+        output = os.path.join(directory, 'files.csv')
+        frames_output = os.path.join(directory, 'frames.csv')
+        sys.argv[1:] = ['scan', '-j', '2', '-o', output,
+                        '--frames-output', frames_output, directory]
+        sys.stderr = StringIO()
+        try:
+            with self.assertRaises(SystemExit) as e:
+                cmain.main()
+        finally:
+            sys.stderr = sys.__stderr__
+        self.assertEqual(e.exception.code, 1)
+        with open(output) as f:
+            files = sorted(csv.DictReader(f), key=lambda row: row['file'])
+        self.assertEqual([row['exit_code'] for row in files], ['9', '0', '0'])
+        self.assertEqual(files[1]['frames'], '2')
+        self.assertEqual(files[1]['loop_count'], '0')
+        self.assertEqual(files[2]['loop_count'], '')
+        with open(frames_output) as f:
+            frames = list(csv.DictReader(f))
+        self.assertEqual(len(frames), 3)
+        self.assertEqual({row['delay'] for row in frames}, {'112', '0'})
+
+    def test_scan_files_window(self):
+        taken = []
+
+        def filenames():
+            for i in range(40):
+                taken.append(i)
+                yield 'test_suite/good/4x4.gif'
+        rows = cmain.scan_files(filenames(), jobs=2)
+        next(rows)
+        self.assertLessEqual(len(taken), cmain.SCAN_WINDOW * 2 + 1)
+        self.assertEqual(len(list(rows)), 39)
+
+    def test_main_scan_jsonl(self):
+        filename = write_gif(self, GifGenerator.generate_gif(
+            8, 8, 3, colors=4, disposal=[1, 2], loop=5))
+        sys.argv[1:] = ['scan', '-j', '1', '-f', 'jsonl', filename]
+        out = StringIO()
+        sys.stdout = out
+        sys.stderr = StringIO()
+        try:
+            with self.assertRaises(SystemExit) as e:
+                cmain.main()
+        finally:
+            sys.stdout = sys.__stdout__
+            sys.stderr = sys.__stderr__
+        self.assertEqual(e.exception.code, 0)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row['type'] for row in rows],
+                         ['file', 'frame', 'frame', 'frame'])
+        self.assertEqual(rows[0]['loop_count'], 5)
+        self.assertEqual([row['disposal'] for row in rows[1:]], [1, 2, 1])
+
+    def test_main_profile(self):
+        sys.argv[1:] = ['--profile', 'test_suite/good/10x10.gif', 'raw_data']
+        err = StringIO()
+        sys.stdout = StringIO()
+        sys.stderr = err
+        try:
+            cmain.main()
+        finally:
+            sys.stdout = sys.__stdout__
+            sys.stderr = sys.__stderr__
+        self.assertIn('Profile:', err.getvalue())
+        self.assertIn('parse', err.getvalue())
+
     def test_main_create_bmp_errors(self):
         sys.argv[1:] = ['--bmp', '2:1', 'test_suite/good/10x10.gif']
         with self.assertRaises(SystemExit):
@@ -83,13 +273,445 @@ class CmainTest(unittest.TestCase):
             expected_result = f.read()
             self.assertEqual(out + '\n', expected_result)
 
+    def test_main_descr_json(self):
+        sys.argv[1:] = ['--json', 'test_suite/good/10x10.gif',
+                        'deciphered_data']
+        out = StringIO()
+        sys.stdout = out
+        try:
+            cmain.main()
+        finally:
+            sys.stdout = sys.__stdout__
+        description = json.loads(out.getvalue())
+        lsd = description['logical_screen_descriptor']
+        self.assertEqual((lsd['width'], lsd['height']), (30, 30))
+        self.assertIs(lsd['global_table'], False)
+        self.assertEqual(len(description['frames']), 2)
+        self.assertEqual(description['frames'][0]['graphic_extension']
+                         ['delay'], 112)
+
+
+class BenchTest(unittest.TestCase):
+    def test_bench_file(self):
+        result = bench_gifinfo.bench_file('test_suite/good/10x10.gif', 1)
+        self.assertEqual(result['frames'], 2)
+        self.assertGreater(result['peak_memory'], 0)
+        for phase in bench_gifinfo.PHASES:
+            self.assertGreaterEqual(result[phase], 0)
+
+    def test_compare(self):
+        baseline = {'files': {'a.gif': {'parse': 0.1, 'lzw': 1.0,
+                                        'composite': 0.001, 'export': 0.1}}}
+        results = {'files': {'a.gif': {'parse': 0.105, 'lzw': 1.5,
+                                       'composite': 0.002, 'export': 0.05},
+                             'b.gif': {'parse': 1, 'lzw': 1,
+                                       'composite': 1, 'export': 1}}}
+        self.assertEqual(bench_gifinfo.compare(results, baseline),
+                         [('a.gif', 'lzw', 1.0, 1.5)])
+        self.assertEqual(len(bench_gifinfo.compare(results, baseline, 0.6)),
+                         0)
+
+
+class GifAsyncTest(unittest.TestCase):
+    def test_aiter_frames_from_stream(self):
+        with open('test_suite/good/big_size.gif', 'rb') as f:
+            data = f.read()
+
+        async def collect():
+            reader = asyncio.StreamReader()
+            for i in range(0, len(data), 1000):
+                reader.feed_data(data[i:i + 1000])
+            reader.feed_eof()
+            return [frame.data async for frame, _
+                    in GifAsync.aiter_frames(reader)]
+        expected = GifInfo('test_suite/good/big_size.gif').frames
+        self.assertEqual(asyncio.run(collect()),
+                         [frame.data for frame in expected])
+
+    def test_aiter_frames_truncated(self):
+        with open('test_suite/good/10x10.gif', 'rb') as f:
+            data = f.read()
+        frames = []
+
+        async def collect():
+            async for frame, _ in GifAsync.aiter_frames(data[:-600]):
+                frames.append(frame)
+        with self.assertRaisesRegex(ValueError, EXCEPTION_MESSAGES[8]):
+            asyncio.run(collect())
+        self.assertEqual(len(frames), 1)
+
+    def test_load_gif(self):
+        gif = asyncio.run(GifAsync.load_gif('test_suite/good/3.gif'))
+        self.assertTrue(all(image is not None for image in gif._images))
+        self.assertEqual(gif.get_all_frames(),
+                         GifInfo('test_suite/good/3.gif').get_all_frames())
+
+
+class GifCacheTest(unittest.TestCase):
+    def test_memory_cache(self):
+        cache = GifCache()
+        self.assertIsNone(cache.get('test_suite/good/3.gif'))
+        gif = cache.open('test_suite/good/3.gif')
+        self.assertEqual(len(gif._frames), 3)
+        self.assertIs(cache.open('test_suite/good/3.gif'), gif)
+        self.assertIs(cache.get('test_suite/good/3.gif'), gif)
+
+    def test_lru_eviction(self):
+        first = GifCache.get_size(GifInfo('test_suite/good/10x10.gif'))
+        second = GifCache.get_size(GifInfo('test_suite/good/4x4.gif'))
+        cache = GifCache(max_bytes=first + second)
+        cache.open('test_suite/good/10x10.gif')
+        cache.open('test_suite/good/4x4.gif')
+        self.assertEqual(len(cache), 2)
+        cache.open('test_suite/good/10x10.gif')
+        cache.open(write_gif(self, GifInfo.get_bytes(
+            'test_suite/good/4x4.gif')))
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('test_suite/good/4x4.gif'))
+        self.assertIsNotNone(cache.get('test_suite/good/10x10.gif'))
+
+    def test_closed_entry(self):
+        cache = GifCache()
+        gif = cache.open('test_suite/good/4x4.gif', use_mmap=True)
+        gif.close()
+        cache.open('test_suite/good/10x10.gif')
+        self.assertEqual(len(cache), 2)
+        gif = cache.open('test_suite/good/4x4.gif', use_mmap=True)
+        self.assertFalse(gif.closed)
+        self.assertEqual(len(gif.frames), 2)
+
+    def test_disk_cache(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        filename = write_gif(self, GifInfo.get_bytes(
+            'test_suite/good/e6aa.gif'))
+        gif = GifInfo(filename, lazy=True)
+        gif.get_frame(20)
+        GifCache(directory=directory).put(filename, gif)
+        cached = GifCache(directory=directory).get(filename)
+        self.assertEqual(len(cached._frames), 21)
+        self.assertEqual(cached._images, [None] * len(cached._images))
+        expected = GifInfo(filename, lazy=True)
+        self.assertEqual(cached.frames[20], expected.frames[20])
+        self.assertEqual(cached.frames[-1], expected.frames[-1])
+        with open(filename, 'ab') as f:
+            f.write(b'\0')
+        self.assertIsNone(GifCache(directory=directory).get(filename))
+
+
+class GifGeneratorTest(unittest.TestCase):
+    def test_encode_lzw(self):
+        rnd = random.Random(0)
+        for min_code_size in (2, 5, 8):
+            indices = bytes(rnd.randrange(1 << min_code_size)
+                            for _ in range(5000))
+            for clear_interval in (None, 1, 3, 100):
+                data = GifGenerator.encode_lzw(indices, min_code_size,
+                                               clear_interval)
+                self.assertEqual(GifInfo.decode_lzw(
+                    [data], min_code_size + 1, len(indices)), indices)
+
+    def test_generate_gif(self):
+        data = GifGenerator.generate_gif(40, 30, 4, colors=7, loop=0)
+        gif = GifInfo(write_gif(self, data))
+        self.assertEqual(len(gif.frames), 4)
+        self.assertEqual(gif.program_extensions[0].app_id, 'NETSCAPE')
+        interlaced = GifInfo(write_gif(self, GifGenerator.generate_gif(
+            40, 30, 4, colors=7, interlaced=True, local_tables=True)))
+        self.assertEqual(interlaced.image_descriptors[0].is_interplace, '1')
+        self.assertTrue(interlaced.image_descriptors[0].lct)
+        self.assertEqual(interlaced.frames[0], gif.frames[0])
+        with cmain.Image.open(write_gif(self, data)) as img:
+            img.seek(3)
+            self.assertEqual(img.convert('RGB').tobytes(), gif.frames[3].data)
+
+    def test_generate_gif_with_disposal(self):
+        data = GifGenerator.generate_gif(
+            20, 16, 6, colors=16, noise=True, image_size=(9, 7),
+            disposal=[1, 2, 1, 0], clear_interval=10)
+        gif = GifInfo(write_gif(self, data))
+        self.assertEqual(gif.frames_info[5], ('0005', '0005', '0009', '0007'))
+        with cmain.Image.open(write_gif(self, data)) as img:
+            for i in range(6):
+                img.seek(i)
+                self.assertEqual(img.convert('RGB').tobytes(),
+                                 gif.frames[i].data)
+
 
 class GifInfoTest(unittest.TestCase):
     def test_good_gif(self):
         gif = GifInfo('test_suite/good/e6aa.gif')
-        print(gif.hexbytes[:26])
+        print(gif.data[:13].hex())
         print(gif)
 
+    def test_lazy_gif(self):
+        gif = GifInfo('test_suite/good/3.gif', lazy=True)
+        self.assertEqual(len(gif.frames), 3)
+        self.assertEqual(gif._frames, [])
+        frame = gif.frames[1]
+        self.assertEqual(len(gif._frames), 2)
+        self.assertIs(gif.get_frame(1), frame)
+        eager_gif = GifInfo('test_suite/good/3.gif')
+        self.assertEqual(gif.frames[:], eager_gif.frames[:])
+
+    def test_mmap_gif(self):
+        with GifInfo('test_suite/good/3.gif', lazy=True,
+                     use_mmap=True) as gif:
+            self.assertIsNotNone(gif.mmap)
+            frames = gif.frames[:]
+            raw_data = gif.image_descriptors[1].raw_data
+        self.assertIsNone(gif.mmap)
+        with self.assertRaises(ValueError):
+            gif.data[0]
+        gif = GifInfo('test_suite/good/3.gif')
+        self.assertEqual(frames, gif.frames[:])
+        self.assertEqual(raw_data, gif.image_descriptors[1].raw_data)
+        with self.assertRaisesRegex(ValueError, EXCEPTION_MESSAGES[3]):
+            GifInfo(write_gif(self, b''), use_mmap=True)
+
+    def test_stats(self):
+        reports = []
+        stats = Stats(reports.append, interval=60)
+        gif = GifInfo('test_suite/good/3.gif', stats)
+        self.assertEqual(set(stats.times), {'parse', 'lzw', 'composite'})
+        self.assertEqual(sorted(stats.lzw_times), [0, 1, 2])
+        self.assertEqual(stats.counts['bytes'], len(gif.data))
+        self.assertEqual(stats.counts['compressed_bytes'],
+                         sum(descr.graphic_block.compressed_size
+                             for descr in gif.image_descriptors))
+        self.assertEqual(len(reports), 2)
+        self.assertEqual(reports[-1], 100)
+        self.assertIn('lzw of image', str(stats))
+
+    def test_frame_buffer(self):
+        gif = GifInfo('test_suite/good/4x4.gif')
+        frame = gif.frames[0]
+        self.assertEqual((frame.width, frame.height), (4, 4))
+        self.assertEqual(len(frame.data), 4 * 4 * 3)
+        self.assertEqual(frame.get_row(1).tobytes(), frame.data[12:24])
+        self.assertEqual(frame.get_pixel(2, 1), tuple(frame.data[18:21]))
+
+    def test_delta_frames(self):
+        data = GifGenerator.generate_gif(40, 30, 40, colors=8,
+                                         disposal=[1, 2, 3],
+                                         image_size=(8, 6), transparency=2)
+        gif = GifInfo(data=data, lazy=True, delta_frames=True)
+        expected = GifInfo(data=data).frames
+        self.assertEqual(gif.frames[30], expected[30])
+        self.assertEqual(gif.frames[:], expected[:])
+        self.assertEqual(gif.frames[5], expected[5])
+        frames = gif._frames
+        self.assertLessEqual(len(frames.cache), frames.cache_size)
+        self.assertLess(frames.stored_bytes,
+                        sum(len(frame.data) for frame in expected) // 4)
+        # the image and the rectangle disposed of the previous one
+        self.assertEqual(expected[2].dirty, (1, 1, 9, 7))
+
+    def test_decode_images_in_processes(self):
+        gif = GifInfo('test_suite/good/3.gif', lazy=True)
+        gif.decode_images(2)
+        self.assertNotIn(None, gif._images)
+        self.assertEqual(gif._frames, [])
+        parallel_gif = GifInfo('test_suite/good/3.gif', jobs=2)
+        self.assertEqual(gif.frames[:], parallel_gif.frames[:])
+
+    @unittest.skipUnless(gifinfo_module.numpy, 'numpy is not installed')
+    def test_numpy_compositor(self):
+        gif = GifInfo('test_suite/good/swim.gif', lazy=True)
+        python_gif = GifInfo('test_suite/good/swim.gif', lazy=True)
+        python_gif.compositor.use_numpy = False
+        self.assertTrue(gif.compositor.use_numpy)
+        self.assertEqual(gif.frames[:], python_gif.frames[:])
+
+    def get_colors(self, frame):
+        colors = [PALETTE[i:i + 3] for i in range(0, len(PALETTE), 3)]
+        return [colors.index(frame.data[i:i + 3])
+                for i in range(0, len(frame.data), 3)]
+
+    def test_disposal_restore_background(self):
+        filename = write_gif(self, build_gif(3, 1, [
+            (0, 0, 3, 1, [RED, RED, RED], 1, None),
+            (1, 0, 1, 1, [GREEN], 2, None),
+            (2, 0, 1, 1, [BLUE], 0, None)]))
+        gif = GifInfo(filename)
+        self.assertEqual(self.get_colors(gif.frames[1]), [RED, GREEN, RED])
+        self.assertEqual(self.get_colors(gif.frames[2]), [RED, WHITE, BLUE])
+
+    def test_disposal_restore_previous(self):
+        filename = write_gif(self, build_gif(3, 1, [
+            (0, 0, 3, 1, [RED, RED, RED], 1, None),
+            (0, 0, 2, 1, [GREEN, GREEN], 3, None),
+            (1, 0, 2, 1, [BLUE, BLUE], 3, None),
+            (2, 0, 1, 1, [GREEN], 1, None)]))
+        gif = GifInfo(filename)
+        self.assertEqual(self.get_colors(gif.frames[1]), [GREEN, GREEN, RED])
+        self.assertEqual(self.get_colors(gif.frames[2]), [RED, BLUE, BLUE])
+        self.assertEqual(self.get_colors(gif.frames[3]), [RED, RED, GREEN])
+
+    def test_transparency(self):
+        filename = write_gif(self, build_gif(3, 1, [
+            (0, 0, 3, 1, [RED, BLUE, RED], 1, BLUE),
+            (0, 0, 3, 1, [GREEN, BLUE, WHITE], 1, BLUE)]))
+        gif = GifInfo(filename)
+        self.assertEqual(self.get_colors(gif.frames[0]), [RED, WHITE, RED])
+        self.assertEqual(self.get_colors(gif.frames[1]),
+                         [GREEN, WHITE, WHITE])
+
+    def test_interlaced_rows(self):
+        rows = GifInfo.get_interlaced_rows(2, 2 * 10)
+        self.assertEqual(rows, [0, 16, 8, 4, 12, 2, 6, 10, 14, 18])
+
+    def test_interlaced_gif(self):
+        for height in (16, 37, 203):
+            img = cmain.Image.new('RGB', (45, height), 'white')
+            for y in range(height):
+                for x in range(0, 45, 3):
+                    img.putpixel((x + y % 3, y), (y % 256, x * 5, 128))
+            img = img.convert('P', palette=cmain.Image.ADAPTIVE, colors=64)
+            filename = write_gif(self, b'')
+            img.save(filename, interlace=True)
+            gif = GifInfo(filename)
+            self.assertEqual(gif.image_descriptors[0].is_interplace, '1')
+            with cmain.Image.open(filename) as expected:
+                self.assertEqual(gif.frames[0].data,
+                                 expected.convert('RGB').tobytes())
+
+    def test_iter_frames(self):
+        gif = GifInfo('test_suite/good/3.gif')
+        with open('test_suite/good/3.gif', 'rb') as f:
+            frames = list(GifInfo.iter_frames(f))
+        self.assertEqual([frame for frame, _ in frames], gif.frames[:])
+        self.assertEqual([ext.delay for _, ext in frames],
+                         [descr.graphic_extension.delay
+                          for descr in gif.image_descriptors])
+
+    def test_iter_frames_in_place(self):
+        gif = GifInfo('test_suite/good/swim.gif')
+        frames = []
+        for frame, _ in GifInfo.iter_frames('test_suite/good/swim.gif',
+                                            copy=False):
+            self.assertTrue(not frames or frame is frames[-1][0])
+            frames.append((frame, bytes(frame.data)))
+        self.assertEqual([data for _, data in frames],
+                         [bytes(frame.data) for frame in gif.frames[:]])
+
+    def test_iter_frames_with_bad_byte(self):
+        with self.assertRaisesRegex(ValueError, EXCEPTION_MESSAGES[9]):
+            list(GifInfo.iter_frames('test_suite/bad/0646.gif'))
+
+    def test_incremental_parser(self):
+        with open('test_suite/good/10x10.gif', 'rb') as f:
+            data = f.read()
+        parser = IncrementalParser()
+        events = []
+        for i in range(len(data)):
+            events += parser.feed(data[i:i + 1])
+        parser.close()
+        self.assertEqual([kind for kind, _ in events],
+                         ['header', 'color_table', 'extension', 'extension',
+                          'image', 'frame', 'extension', 'image', 'frame',
+                          'end'])
+        self.assertEqual(parser.position, len(data))
+        self.assertEqual(events[4][1].graphic_extension.delay, 112)
+        self.assertEqual([value for kind, value in events if kind == 'frame'],
+                         GifInfo('test_suite/good/10x10.gif').frames[:])
+
+    def test_incremental_parser_errors(self):
+        with open('test_suite/good/10x10.gif', 'rb') as f:
+            data = f.read()
+        parser = IncrementalParser(composite=False)
+        parser.feed(data[:-600])
+        with self.assertRaisesRegex(ValueError, EXCEPTION_MESSAGES[8]):
+            parser.close()
+        parser = IncrementalParser()
+        with open('test_suite/bad/0646.gif', 'rb') as f:
+            events = parser.feed(f.read())
+        self.assertEqual(sum(kind == 'frame' for kind, _ in events), 7)
+        with self.assertRaisesRegex(ValueError, EXCEPTION_MESSAGES[9]):
+            parser.close()
+
+    def test_incremental_parser_checks_fixed_fields(self):
+        for name, code in [('2b5b', 5), ('243d', 6), ('7092', 6)]:
+            with open('test_suite/bad/{}.gif'.format(name), 'rb') as f:
+                data = f.read()
+            parser = IncrementalParser(composite=False)
+            with self.assertRaisesRegex(ValueError,
+                                        re.escape(EXCEPTION_MESSAGES[code])):
+                for i in range(0, len(data), 100):
+                    parser.feed(data[i:i + 100])
+                parser.close()
+            # raised when the broken block starts, not at the end
+            self.assertLess(len(parser.buffer), 100 + 11 + 3 * 256)
+
+    def test_gif_index(self):
+        gif = GifInfo('test_suite/good/e6aa.gif', lazy=True)
+        data = GifInfo.get_bytes('test_suite/good/e6aa.gif')
+        index = GifIndex.build(data)
+        self.assertEqual(len(index), len(gif.frames))
+        self.assertEqual(index.frames[0][0],
+                         gif.image_descriptors[0].offset)
+        self.assertEqual(index.get_frame(data, 40), gif.frames[40])
+        self.assertEqual(sorted(index.keyframes), [16, 32])
+        self.assertEqual(index.get_frame(data, -1), gif.frames[-1])
+
+    def test_gif_index_keyframes_with_disposal(self):
+        filename = write_gif(self, build_gif(3, 1, [
+            (0, 0, 3, 1, [RED, RED, RED], 1, None),
+            (0, 0, 2, 1, [GREEN, GREEN], 3, None),
+            (1, 0, 1, 1, [BLUE], 2, None),
+            (2, 0, 1, 1, [GREEN], 1, None)]))
+        gif = GifInfo(filename)
+        data = GifInfo.get_bytes(filename)
+        index = GifIndex.build(data)
+        index.keyframe_interval = 1
+        self.assertEqual(index.get_frame(data, 3), gif.frames[3])
+        self.assertEqual(sorted(index.keyframes), [1, 2, 3])
+        for i in range(4):
+            self.assertEqual(index.get_frame(data, i), gif.frames[i])
+
+    def test_gif_index_sidecar(self):
+        data = GifInfo.get_bytes('test_suite/good/e6aa.gif')
+        filename = write_gif(self, data)
+        self.addCleanup(os.remove, filename + INDEX_EXTENSION)
+        self.assertIsNone(GifIndex.load(filename))
+        index = GifIndex.build(data)
+        frame = index.get_frame(data, 20)
+        index.save(filename)
+        loaded = GifIndex.load(filename)
+        self.assertEqual(loaded.frames, index.frames)
+        self.assertEqual(loaded.keyframes, index.keyframes)
+        self.assertEqual(loaded.get_frame(data, 20), frame)
+        with open(filename, 'ab') as f:
+            f.write(b'\0')
+        self.assertIsNone(GifIndex.load(filename))
+
+    def test_gif_index_damaged_sidecar(self):
+        data = GifInfo.get_bytes('test_suite/good/e6aa.gif')
+        filename = write_gif(self, data)
+        self.addCleanup(os.remove, filename + INDEX_EXTENSION)
+        index = GifIndex.build(data)
+        index.get_frame(data, 20)
+        index.save(filename)
+        with open(filename + INDEX_EXTENSION) as f:
+            saved = json.load(f)
+        keyframe = next(iter(saved['keyframes']))
+        for damage in [{'keyframes': {keyframe: 'AAAA'}},
+                       {'keyframes': {keyframe: '!'}},
+                       {'keyframes': None},
+                       {'frames': [1]}]:
+            with open(filename + INDEX_EXTENSION, 'w') as f:
+                json.dump(dict(saved, **damage), f)
+            self.assertIsNone(GifIndex.load(filename))
+        for body in [{k: v for k, v in saved.items() if k != 'frames'}, []]:
+            with open(filename + INDEX_EXTENSION, 'w') as f:
+                json.dump(body, f)
+            self.assertIsNone(GifIndex.load(filename))
+
+    def test_lazy_gif_with_bad_graphic_block(self):
+        gif = GifInfo('test_suite/bad/ea75.gif', lazy=True)
+        with self.assertRaisesRegex(ValueError, EXCEPTION_MESSAGES[16]):
+            gif.frames[-1]
+
     def test_gif_with_bad_byte(self):
         with self.assertRaisesRegex(ValueError, EXCEPTION_MESSAGES[9]):
             GifInfo('test_suite/bad/0646.gif')
@@ -119,7 +741,7 @@ class GifInfoTest(unittest.TestCase):
             GifInfo('test_suite/bad/adaf.gif')
 
     def test_gif_with_unexpected_extension(self):
-        with self.assertRaises(KeyError):
+        with self.assertRaisesRegex(ValueError, EXCEPTION_MESSAGES[8]):
             GifInfo('test_suite/bad/bc7a.gif')
 
     def test_gif_with_wrong_header(self):
@@ -135,8 +757,8 @@ class GifInfoTest(unittest.TestCase):
             GifInfo('test_suite/bad/ea75.gif')
 
     def test_get_lsd(self):
-        hexbytes = '4749463839613c003c00f7fa00'
-        lsd = LogicalScreenDescriptor(hexbytes)
+        data = bytes.fromhex('4749463839613c003c00f7fa00')
+        lsd = LogicalScreenDescriptor(data)
         self.assertEqual('003c', lsd.width)
         self.assertEqual('003c', lsd.height)
         self.assertEqual('11110111', lsd.packed_fields)
@@ -144,8 +766,8 @@ class GifInfoTest(unittest.TestCase):
         self.assertEqual('00', lsd.ratio)
 
     def test_get_image_descriptor(self):
-        hexbytes = '2c000000003c003c0087'
-        id = ImageDescriptor(hexbytes)
+        data = bytes.fromhex('2c000000003c003c0087')
+        id = ImageDescriptor(data)
         self.assertEqual(id.left, '0000')
         self.assertEqual(id.top, '0000')
         self.assertEqual(id.width, '003c')
@@ -155,14 +777,47 @@ class GifInfoTest(unittest.TestCase):
         self.assertEqual(id.size_local_table, 256)
         self.assertEqual(id.is_sorted_pal, '0')
 
+    def test_color_table(self):
+        table = ColorTable(b'\0' + PALETTE, True, 4, 1)
+        self.assertEqual(len(table), 4)
+        self.assertEqual(table.rgb[:12], PALETTE)
+        self.assertEqual(len(table.rgb), 256 * 3)
+        self.assertEqual(table.channels[0][:4], bytes([255, 255, 0, 0]))
+        self.assertEqual(table.color_table,
+                         ['ffffff', 'ff0000', '00ff00', '0000ff'])
+        self.assertFalse(ColorTable(PALETTE, False, 4))
+
     def test_bad_logical_image_descriptor(self):
         with self.assertRaisesRegex(ValueError, EXCEPTION_MESSAGES[3]):
-            LogicalScreenDescriptor('23156ytrgfd')
+            LogicalScreenDescriptor(b'23156ytrgfd')
+
+    def test_decode_lzw(self):
+        # 'ABABABA' over a 2-color table: clear, 0, 1, 6, 8, end
+        subblocks = [bytes.fromhex('448c05')]
+        result = GifInfo.decode_lzw(subblocks, 3, 7)
+        self.assertEqual(result, bytearray([0, 1, 0, 1, 0, 1, 0]))
+        data = memoryview(bytes.fromhex('448c05'))
+        result = GifInfo.decode_lzw([data[:1], data[1:]], 3, 7)
+        self.assertEqual(result, bytearray([0, 1, 0, 1, 0, 1, 0]))
+
+    def test_graphic_block(self):
+        data = memoryview(bytes.fromhex('0203448c05024a010005'))
+        graphic_block = GraphicBlock(data)
+        self.assertEqual([bytes(sb) for sb in graphic_block.subblocks],
+                         [bytes.fromhex('448c05'), bytes.fromhex('4a01')])
+        self.assertIsInstance(graphic_block.subblocks[0], memoryview)
+        self.assertEqual(graphic_block.size_block, 9)
+        self.assertEqual(graphic_block.compressed_size, 5)
+        with self.assertRaisesRegex(ValueError, EXCEPTION_MESSAGES[8]):
+            GraphicBlock(data[:6])
 
-    def test_initialize_lzw_dict(self):
-        lzw_dict = GifInfo.initialize_lzw_dict(3)
-        expected = {0: [0], 1: [1], 2: [2], 3: [3], 4: 'clear', 5: 'end'}
-        self.assertEqual(lzw_dict, expected)
+    def test_decode_lzw_errors(self):
+        with self.assertRaisesRegex(IndexError, EXCEPTION_MESSAGES[18]):
+            GifInfo.decode_lzw([bytes.fromhex('448c05')], 3, 8)
+        with self.assertRaisesRegex(ValueError, EXCEPTION_MESSAGES[16]):
+            GifInfo.decode_lzw([bytes.fromhex('448c')], 3, 8)
+        with self.assertRaises(KeyError):
+            GifInfo.decode_lzw([bytes.fromhex('3c00')], 3, 7)
 
     def test_read_xmp_packet(self):
         hexbytes = 'aa32ff454afe54a5fd45a4fc5a45fb45a6fa157f9687123ffab12bf001'
@@ -171,9 +826,11 @@ class GifInfoTest(unittest.TestCase):
             if len(hexbyte) == 1:
                 hexbyte = '0' + hexbyte
             hexbytes += hexbyte
-        xmp, size = ProgramExtension.read_xmp_packet(hexbytes)
+        data = bytes.fromhex(hexbytes)
+        xmp, size = ProgramExtension.read_xmp_packet(data)
         expected = 'aa32454a54a545a45a4545a6157f9687123ffab12bf001'
-        self.assertEqual(xmp, expected)
+        self.assertEqual(xmp.hex(), expected)
+        self.assertEqual(size, len(data) + 2)
 
 
 if __name__ == '__main__':